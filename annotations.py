@@ -0,0 +1,329 @@
+import os
+import re
+import json
+import array
+import numpy as np
+
+JSON_CHUNK = 1 << 16
+WRITE_ROWS = 10000
+DELIMITERS = frozenset(' \t\n\r,:]}')
+SEPARATOR = re.compile(r'[ \t\n\r]*([,\]])[ \t\n\r]*')
+
+
+class AnnotationStore:
+    # Rows are kept sorted by start time. Together with a running maximum of the end
+    # times this gives bisect-based range queries without a separate tree structure.
+    def __init__(self, capacity=64):
+        self._starts = np.empty(capacity, dtype=np.float64)
+        self._ends = np.empty(capacity, dtype=np.float64)
+        self._label_ids = np.empty(capacity, dtype=np.int32)
+        self._max_ends = np.empty(capacity, dtype=np.float64)
+        self._max_valid = 0
+        self.count = 0
+        self.labels = []
+        self.label_index = {}
+
+    @property
+    def starts(self):
+        return self._starts[:self.count]
+
+    @property
+    def ends(self):
+        return self._ends[:self.count]
+
+    @property
+    def label_ids(self):
+        return self._label_ids[:self.count]
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if not -self.count <= index < self.count:
+            raise IndexError(index)
+        index %= self.count
+        return {"start": float(self._starts[index]), "end": float(self._ends[index]),
+                "label": self.labels[self._label_ids[index]]}
+
+    def __iter__(self):
+        for i in range(self.count):
+            yield self[i]
+
+    def label_id(self, label):
+        label_id = self.label_index.get(label)
+        if label_id is None:
+            label_id = len(self.labels)
+            self.labels.append(label)
+            self.label_index[label] = label_id
+        return label_id
+
+    def _reserve(self, size):
+        if size <= len(self._starts): return
+        capacity = max(size, 2 * len(self._starts))
+        for name in ("_starts", "_ends", "_label_ids", "_max_ends"):
+            old = getattr(self, name)
+            new = np.empty(capacity, dtype=old.dtype)
+            new[:self.count] = old[:self.count]
+            setattr(self, name, new)
+
+    def insert_position(self, start):
+        return int(np.searchsorted(self.starts, start, side='right'))
+
+    def extend_ids(self, starts, ends, label_ids, labels):
+        # Bulk insert with label ids that index into `labels` rather than into self.labels
+        remap = np.array([self.label_id(label) for label in labels] or [0], dtype=np.int32)
+        self._extend_columns(starts, ends, remap[np.asarray(label_ids, dtype=np.int64)])
+
+    def add(self, start, end, label):
+        row = self.insert_position(start)
+        self._reserve(self.count + 1)
+        for arr, value in ((self._starts, start), (self._ends, end), (self._label_ids, self.label_id(label))):
+            arr[row + 1:self.count + 1] = arr[row:self.count]
+            arr[row] = value
+        self.count += 1
+        self._max_valid = min(self._max_valid, row)
+        return row
+
+    def extend(self, starts, ends, labels):
+        self._extend_columns(starts, ends, [self.label_id(label) for label in labels])
+
+    def _extend_columns(self, starts, ends, label_ids):
+        n = len(starts)
+        self._reserve(self.count + n)
+        a, b = self.count, self.count + n
+        self._starts[a:b] = starts
+        self._ends[a:b] = ends
+        self._label_ids[a:b] = label_ids
+        self.count = b
+        new = self._starts[a:b]
+        if n and ((a and new[0] < self._starts[a - 1]) or np.any(np.diff(new) < 0)):
+            order = np.argsort(self.starts, kind='stable')
+            for arr in (self._starts, self._ends, self._label_ids):
+                arr[:b] = arr[:b][order]
+            a = 0
+        self._max_valid = min(self._max_valid, a)
+
+    def remove(self, row):
+        for arr in (self._starts, self._ends, self._label_ids):
+            arr[row:self.count - 1] = arr[row + 1:self.count]
+        self.count -= 1
+        self._max_valid = min(self._max_valid, row)
+
+    def set_label(self, row, label):
+        self._label_ids[row] = self.label_id(label)
+
+    def clear(self):
+        self.count = 0
+        self._max_valid = 0
+        self.labels = []
+        self.label_index = {}
+
+    def to_list(self):
+        return list(self)
+
+    def _max_end_prefix(self):
+        # Running maximum of end times in start order, rebuilt from the first changed row only
+        a = self._max_valid
+        if a < self.count:
+            acc = np.maximum.accumulate(self._ends[a:self.count])
+            if a > 0:
+                np.maximum(acc, self._max_ends[a - 1], out=acc)
+            self._max_ends[a:self.count] = acc
+            self._max_valid = self.count
+        return self._max_ends[:self.count]
+
+    @property
+    def max_end(self):
+        # Latest end time: the last entry of the running maximum
+        return self._max_end_prefix()[-1]
+
+    def visible(self, x_min, x_max):
+        hi = int(np.searchsorted(self.starts, x_max, side='right'))
+        lo = int(np.searchsorted(self._max_end_prefix()[:hi], x_min, side='left'))
+        return lo + np.nonzero(self._ends[lo:hi] >= x_min)[0]
+
+    def index_at(self, x):
+        hits = self.visible(x, x)
+        return int(hits[-1]) if len(hits) else None
+
+    def find(self, start, end, label):
+        label_id = self.label_index.get(label)
+        for row in self.visible(start, start):
+            if self._starts[row] == start and self._ends[row] == end and self._label_ids[row] == label_id:
+                return int(row)
+        return None
+
+    def overlapping(self, start, end):
+        hits = self.visible(start, end)
+        return hits[(self._ends[hits] > start) & (self._starts[hits] < end)]
+
+    def next_after(self, x):
+        row = int(np.searchsorted(self.starts, x, side='right'))
+        return row if row < self.count else None
+
+    def previous_before(self, x):
+        row = int(np.searchsorted(self.starts, x, side='left')) - 1
+        return row if row >= 0 else None
+
+
+class _JsonStream:
+    # Pulls one JSON value at a time out of a file without reading it whole
+    WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+    def __init__(self, f, chunk_size=JSON_CHUNK):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self):
+        data = self.f.read(self.chunk_size)
+        if not data:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + data
+        self.pos = 0
+        return True
+
+    def peek(self):
+        while True:
+            self.pos = self.WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"Expected '{char}' in annotation file")
+        self.pos += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                obj, end = self.decoder.raw_decode(self.buf, self.pos)
+                # A number cut by the end of the buffer may continue in the next chunk
+                if self.eof or (end < len(self.buf) and self.buf[end] in DELIMITERS):
+                    self.pos = end
+                    return obj
+            except json.JSONDecodeError:
+                if self.eof: raise
+            self._fill()
+
+
+def read_json(path, store):
+    meta = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        stream = _JsonStream(f)
+        stream.expect('{')
+        if stream.peek() == '}': return meta
+        while True:
+            key = stream.value()
+            stream.expect(':')
+            if key == "annotations":
+                _read_annotation_array(stream, store)
+            else:
+                meta[key] = stream.value()
+            char = stream.peek()
+            stream.pos += 1
+            if char == '}': return meta
+            if char != ',':
+                raise ValueError("Malformed annotation file")
+
+
+def _read_annotation_array(stream, store):
+    starts, ends, label_ids = array.array('d'), array.array('d'), array.array('i')
+    label_index, labels = {}, []
+    decode = stream.decoder.scan_once
+    separator = SEPARATOR.match
+    stream.expect('[')
+    if stream.peek() == ']':
+        stream.pos += 1
+        return
+    while True:
+        # Fast path decodes straight from the buffer; near a chunk boundary fall back to the stream
+        try:
+            ann, end = decode(stream.buf, stream.pos)
+        except (StopIteration, ValueError):
+            ann = stream.value()
+        else:
+            stream.pos = end
+        match = separator(stream.buf, stream.pos)
+        if match is None:
+            char = stream.peek()
+            stream.pos += 1
+        else:
+            char = match.group(1)
+            stream.pos = match.end()
+        starts.append(ann['start'])
+        ends.append(ann['end'])
+        label_id = label_index.get(ann['label'])
+        if label_id is None:
+            label_id = label_index[ann['label']] = len(labels)
+            labels.append(ann['label'])
+        label_ids.append(label_id)
+        if char == ']': break
+        if char != ',':
+            raise ValueError("Malformed annotation list")
+    store.extend_ids(np.frombuffer(starts, dtype=np.float64), np.frombuffer(ends, dtype=np.float64),
+                     np.frombuffer(label_ids, dtype=np.int32), labels)
+
+
+def write_json(path, starts, ends, label_ids, labels, header, indent=4, sync=False):
+    # Same output as json.dump(..., indent=indent), written a block of rows at a time
+    quoted = [json.dumps(label) for label in labels]
+    if indent:
+        pad = " " * indent
+        head = "{\n" + "".join(f"{pad}{json.dumps(k)}: {json.dumps(v)},\n" for k, v in header.items())
+        row = f"{pad * 2}{{{{\n{pad * 3}\"start\": {{}},\n{pad * 3}\"end\": {{}},\n{pad * 3}\"label\": {{}}\n{pad * 2}}}}}"
+        sep, open_list, close_list = ",\n", f'{pad}"annotations": [\n', f"\n{pad}]\n}}"
+        empty = f'{pad}"annotations": []\n}}'
+    else:
+        head = "{" + "".join(f"{json.dumps(k)}: {json.dumps(v)}, " for k, v in header.items())
+        row = '{{"start": {}, "end": {}, "label": {}}}'
+        sep, open_list, close_list = ", ", '"annotations": [', "]}"
+        empty = open_list + close_list
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(head)
+        if len(starts) == 0:
+            f.write(empty)
+        else:
+            f.write(open_list)
+            for a in range(0, len(starts), WRITE_ROWS):
+                b = a + WRITE_ROWS
+                if a: f.write(sep)
+                f.write(sep.join(row.format(repr(s), repr(e), quoted[i]) for s, e, i in
+                                 zip(starts[a:b].tolist(), ends[a:b].tolist(), label_ids[a:b].tolist())))
+            f.write(close_list)
+        if sync:
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def read_npz(path, store):
+    with np.load(path, allow_pickle=False) as data:
+        store.extend_ids(data["starts"], data["ends"], data["label_ids"], [str(l) for l in data["labels"]])
+        return {"file": str(data["audio_file"]), "duration": float(data["duration"])}
+
+
+def write_npz(path, store, header):
+    with open(path, 'wb') as f:
+        np.savez(f, starts=store.starts, ends=store.ends, label_ids=store.label_ids,
+                 labels=np.array(store.labels, dtype=np.str_),
+                 audio_file=np.array(header.get("file", "")), duration=np.array(header.get("duration", 0.0)))
+
+
+def read_annotation_file(path, store):
+    if path.lower().endswith(".npz"):
+        return read_npz(path, store)
+    return read_json(path, store)
+
+
+def write_annotation_file(path, store, header):
+    if path.lower().endswith(".npz"):
+        write_npz(path, store, header)
+    else:
+        write_json(path, store.starts, store.ends, store.label_ids, store.labels, header)
@@ -0,0 +1,162 @@
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from cache import DecodeCache
+from config import CACHE_DIR, CACHE_MAX_BYTES
+from decoders import AUDIO_EXTENSIONS, decode_store
+from peaks import PeakPyramid
+from spectrogram import compute_level, overview_levels
+
+REPORT_NAME = "batch_report.jsonl"
+SILENCE_DB = -60.0
+CLIP_LEVEL = 0.999
+
+
+def find_audio_files(root):
+    files = []
+    for folder, dirs, names in os.walk(root):
+        dirs.sort()
+        files.extend(os.path.join(folder, n) for n in sorted(names) if n.lower().endswith(AUDIO_EXTENSIONS))
+    return files
+
+
+def signal_stats(y, sr):
+    if len(y) == 0:
+        return {}
+    peak = float(np.max(np.abs(y)))
+    rms = float(np.sqrt(np.mean(np.square(y, dtype=np.float64))))
+    # Share of 10 ms frames quieter than SILENCE_DB
+    size = max(1, int(sr) // 100)
+    frames = y[:len(y) // size * size].reshape(-1, size)
+    frame_rms = np.sqrt(np.mean(np.square(frames, dtype=np.float64), axis=1)) if len(frames) else np.zeros(1)
+    return {
+        "peak_db": round(20 * float(np.log10(peak + 1e-12)), 2),
+        "rms_db": round(20 * float(np.log10(rms + 1e-12)), 2),
+        "dc_offset": round(float(np.mean(y, dtype=np.float64)), 6),
+        "clipped": int(np.count_nonzero(np.abs(y) >= CLIP_LEVEL)),
+        "silence": round(float(np.mean(20 * np.log10(frame_rms + 1e-12) < SILENCE_DB)), 4),
+    }
+
+
+def process_file(path, cache_root, spectrogram=False, stats=False):
+    # Runs in a worker process; everything it needs is rebuilt from plain arguments
+    cache = DecodeCache(cache_root)
+    record = {"path": path, "key": cache.key(path)}
+    timings = record["timings"] = {}
+    t0 = time.perf_counter()
+    cached = cache.load(path)
+    if cached:
+        store, sr, pyramid = cached
+        timings["cache_hit"] = round(time.perf_counter() - t0, 4)
+    else:
+        store, sr = decode_store(path)
+        t1 = time.perf_counter()
+        pyramid = PeakPyramid(store.view())
+        t2 = time.perf_counter()
+        cache.store(path, store, sr, pyramid, evict=False)
+        timings.update(decode=round(t1 - t0, 4), peaks=round(t2 - t1, 4), store=round(time.perf_counter() - t2, 4))
+    # Spectrograms and statistics describe the mix, as in the editor's default view
+    y = store.view()
+    record.update(sr=float(sr), duration=len(y) / sr, channels=store.channels)
+    if spectrogram and len(y):
+        t = time.perf_counter()
+        for level in overview_levels(len(y)):
+            cache.store_spectrogram(path, level, compute_level(y, level))
+        timings["spectrogram"] = round(time.perf_counter() - t, 4)
+    if stats:
+        t = time.perf_counter()
+        record["stats"] = signal_stats(y, sr)
+        timings["stats"] = round(time.perf_counter() - t, 4)
+    record["seconds"] = round(time.perf_counter() - t0, 4)
+    record["status"] = "ok"
+    return record
+
+
+def load_report(path):
+    # Latest successful record per file; a torn last line from an interrupted run is ignored
+    done = {}
+    if not os.path.exists(path): return done
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get("status") == "ok":
+                done[record["path"]] = record
+    return done
+
+
+def is_done(record, cache, options):
+    try:
+        if record["key"] != cache.key(record["path"]): return False
+    except OSError:
+        return False
+    if not os.path.isfile(os.path.join(cache.entry_dir(record["path"]), "meta.json")): return False
+    if options.spectrogram and "spectrogram" not in record["timings"]: return False
+    return not options.stats or "stats" in record
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="main.py batch",
+                                     description="Decode a folder tree into the audio cache without starting the GUI.")
+    parser.add_argument("root", help="directory to scan for audio files")
+    parser.add_argument("--jobs", "-j", type=int, default=os.cpu_count() or 1, help="worker processes")
+    parser.add_argument("--spectrogram", action="store_true", help="also precompute overview spectrogram levels")
+    parser.add_argument("--stats", action="store_true", help="record peak/RMS/DC/clipping/silence per file")
+    parser.add_argument("--report", default=REPORT_NAME, help=f"JSON-lines report, also used to resume (default {REPORT_NAME})")
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    parser.add_argument("--cache-max-gb", type=float, default=CACHE_MAX_BYTES / 1024 ** 3)
+    parser.add_argument("--force", action="store_true", help="ignore the report and process every file again")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    options = parse_args(sys.argv[1:] if argv is None else argv)
+    root = os.path.abspath(options.root)
+    cache = DecodeCache(options.cache_dir, int(options.cache_max_gb * 1024 ** 3))
+    files = find_audio_files(root)
+    done = {} if options.force else load_report(options.report)
+    todo = [p for p in files if not (p in done and is_done(done[p], cache, options))]
+    print(f"{len(files)} files, {len(files) - len(todo)} already done, {len(todo)} to process with {options.jobs} jobs")
+
+    t0 = time.perf_counter()
+    audio_seconds, failures = 0.0, 0
+    with open(options.report, 'a', encoding='utf-8') as report, \
+            ProcessPoolExecutor(max_workers=max(1, options.jobs)) as pool:
+        futures = {pool.submit(process_file, p, cache.root, options.spectrogram, options.stats): p for p in todo}
+        try:
+            for n, future in enumerate(as_completed(futures), 1):
+                path = futures[future]
+                try:
+                    record = future.result()
+                except Exception as e:
+                    record = {"path": path, "status": "error", "error": f"{type(e).__name__}: {e}"}
+                report.write(json.dumps(record) + "\n")
+                report.flush()
+                name = os.path.relpath(path, root)
+                if record["status"] != "ok":
+                    failures += 1
+                    print(f"[{n}/{len(todo)}] {name}: {record['error']}")
+                    continue
+                audio_seconds += record["duration"]
+                steps = ", ".join(f"{k} {v:.2f}s" for k, v in record["timings"].items())
+                print(f"[{n}/{len(todo)}] {name}: {record['seconds']:.2f}s ({steps})")
+        except KeyboardInterrupt:
+            pool.shutdown(wait=True, cancel_futures=True)
+            print("Interrupted; run again to resume")
+            return 130
+
+    cache.evict()
+    wall = time.perf_counter() - t0
+    speed = f", {audio_seconds / wall:.0f}x realtime" if wall > 0 and audio_seconds else ""
+    print(f"Done in {wall:.1f}s: {len(todo) - failures} ok, {failures} failed, {audio_seconds / 3600:.2f} h of audio{speed}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,364 @@
+import os
+import sys
+import json
+import time
+import glob
+import shutil
+import platform
+import argparse
+import tempfile
+import statistics
+import subprocess
+from types import SimpleNamespace
+import numpy as np
+import soundfile as sf
+
+OUTPUT_NAME = "bench_output.txt"
+DURATIONS = (10, 600, 10800)
+CHANNELS = (1, 2)
+ANNOTATION_COUNTS = (100, 10_000, 100_000)
+# Visible span in seconds for the pan/zoom runs; 0 means the whole file
+ZOOM_SPANS = (0, 60.0, 1.0, 0.01)
+PAN_FRAMES = 60
+PLAYBACK_SECONDS = 10
+SYNTH_BLOCK = 1 << 20
+
+
+def synth(path, seconds, sr, channels):
+    # Noise bursts over a quiet chirp, written in blocks so hours of audio never sit in memory
+    rng = np.random.default_rng(int(seconds) * 10 + channels)
+    total = int(seconds * sr)
+    with sf.SoundFile(path, 'w', samplerate=sr, channels=channels, subtype='PCM_16') as f:
+        for a in range(0, total, SYNTH_BLOCK):
+            t = np.arange(a, min(a + SYNTH_BLOCK, total)) / sr
+            tone = 0.2 * np.sin(2 * np.pi * (200 + 20 * (t % 30)) * t)
+            burst = (t % 4 < 1) * rng.standard_normal(len(t)) * 0.3
+            block = np.stack([tone + burst * (c + 1) / channels for c in range(channels)], axis=1)
+            f.write(block.astype(np.float32))
+
+
+def audio_file(data_dir, seconds, sr, channels):
+    path = os.path.join(data_dir, f"synth_{seconds:g}s_{channels}ch_{sr}.wav")
+    if not os.path.exists(path):
+        synth(path, seconds, sr, channels)
+    # An autosave journal from an earlier run would restore its annotations on open
+    for leftover in glob.glob(glob.escape(path) + ".annotations.*"):
+        os.remove(leftover)
+    return path
+
+
+def git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10)
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+class Recorder:
+    # One JSON object per measurement, appended to the output file so runs can be compared
+    def __init__(self, path, label=None):
+        self.path = path
+        self.run = {"run": time.strftime("%Y-%m-%dT%H:%M:%S"), "label": label, "commit": git_commit(),
+                    "python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count()}
+        self.file = open(path, 'a', encoding='utf-8')
+
+    def add(self, bench, params, seconds, **extra):
+        record = dict(self.run, bench=bench, params=params, n=len(seconds),
+                      median_s=statistics.median(seconds), min_s=min(seconds), max_s=max(seconds),
+                      samples_s=[round(s, 6) for s in seconds], **extra)
+        self.file.write(json.dumps(record) + "\n")
+        self.file.flush()
+        shown = ", ".join(f"{k}={v}" for k, v in params.items())
+        print(f"{bench:<24} {shown:<44} median {record['median_s'] * 1000:10.3f} ms  (n={len(seconds)})")
+        return record
+
+    def close(self):
+        self.file.close()
+
+
+def timed(fn, repeat):
+    seconds = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        seconds.append(time.perf_counter() - t)
+    return seconds
+
+
+class GuiBench:
+    def __init__(self, recorder, options, cache_root):
+        from PyQt6 import QtWidgets
+        from mainwindow import AudioLabeler
+        self.app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([sys.argv[0]])
+        self.recorder = recorder
+        self.options = options
+        self.cache_root = cache_root
+        self.window = AudioLabeler()
+        self.window.resize(1600, 900)
+        self.window.show()
+        # Modal dialogs are answered without a user
+        QtWidgets.QInputDialog.getText = staticmethod(lambda *a, **k: ("bench", True))
+        self.process_events()
+
+    def process_events(self):
+        self.app.processEvents()
+
+    def wait(self, cond, timeout=600.0):
+        deadline = time.perf_counter() + timeout
+        while not cond():
+            if time.perf_counter() > deadline:
+                raise TimeoutError("benchmark step did not finish")
+            self.app.processEvents()
+            time.sleep(0.0005)
+
+    def tiles_settled(self):
+        return not self.window.curve.pending
+
+    def load(self, path, cache):
+        from workers import AudioLoaderThread
+        result, errors = [], []
+        thread = AudioLoaderThread(path, cache)
+        thread.finished_loading.connect(lambda *args: result.append(args))
+        thread.error_occurred.connect(errors.append)
+        thread.start()
+        self.wait(lambda: result or errors)
+        thread.wait()
+        if errors:
+            raise RuntimeError(errors[0])
+        store, sr, _, pyramid = result[0]
+        return store, sr, pyramid
+
+    def decode(self, path, params):
+        from cache import DecodeCache
+
+        def cold():
+            shutil.rmtree(self.cache_root, ignore_errors=True)
+            self.load(path, DecodeCache(self.cache_root))
+
+        self.recorder.add("decode_cold", params, timed(cold, self.options.repeat))
+        self.recorder.add("decode_cached", params,
+                          timed(lambda: self.load(path, DecodeCache(self.cache_root)), self.options.repeat))
+
+    def show(self, path, store, sr, pyramid, params):
+        # From decoded samples to a fully drawn waveform of the whole file
+        def show():
+            self.window.show_audio(path, store, sr, pyramid)
+            self.wait(self.tiles_settled)
+            self.window.plot_widget.viewport().repaint()
+
+        self.recorder.add("show_audio", params, timed(show, self.options.repeat))
+
+    def view(self, duration, params):
+        plot = self.window.plot_widget
+        vb = plot.getViewBox()
+        for span in sorted({min(span or duration, duration) for span in ZOOM_SPANS}, reverse=True):
+            start = max(0.0, duration / 2 - span / 2)
+            self.window.curve.cache.clear()
+            t = time.perf_counter()
+            plot.setXRange(start, start + span, padding=0)
+            plot.viewport().repaint()
+            self.wait(self.tiles_settled)
+            plot.viewport().repaint()
+            settle = time.perf_counter() - t
+            frames = []
+            for i in range(PAN_FRAMES):
+                # Right for the first half, back for the second: the return trip is served from cache
+                step = span * 0.02 * (1 if i < PAN_FRAMES // 2 else -1)
+                t = time.perf_counter()
+                vb.translateBy(x=step)
+                self.process_events()
+                plot.viewport().repaint()
+                frames.append(time.perf_counter() - t)
+            view_params = dict(params, span_s=span)
+            self.recorder.add("zoom_settle", view_params, [settle])
+            self.recorder.add("pan_frame", view_params, frames, p95_s=float(np.percentile(frames, 95)))
+
+    def annotations(self, duration, count, params):
+        w = self.window
+        rng = np.random.default_rng(count)
+        starts = np.sort(rng.uniform(0, max(duration - 1, 0.1), count))
+        ends = starts + rng.uniform(0.05, 1.0, count)
+        labels = [f"label{i % 20}" for i in range(count)]
+        repeat = self.options.repeat
+        params = dict(params, annotations=count)
+
+        t = time.perf_counter()
+        w.annotation_model.clear()
+        w.annotation_model.extend(starts, ends, labels)
+        self.recorder.add("annotations_fill", params, [time.perf_counter() - t])
+
+        def add():
+            a = float(rng.uniform(0, max(duration - 1, 0.1)))
+            w.selection_region.setRegion([a, a + 0.5])
+            w.add_annotation_from_selection()
+
+        def delete():
+            w.set_current_row(int(rng.integers(len(w.annotations))))
+            w.delete_selected_annotation()
+
+        def filter_labels():
+            w.edit_filter.setText("label7")
+            w.edit_filter.setText("")
+
+        def in_view():
+            w.chk_in_view.setChecked(True)
+            w.update_list_time_window()
+            w.chk_in_view.setChecked(False)
+
+        self.recorder.add("annotation_add", params, timed(add, repeat))
+        self.recorder.add("annotation_delete", params, timed(delete, repeat))
+        self.recorder.add("list_filter", params, timed(filter_labels, repeat))
+        self.recorder.add("list_in_view", params, timed(in_view, repeat))
+        self.files(params)
+
+    def files(self, params):
+        from annotations import write_annotation_file
+        w = self.window
+        header = {"file": os.path.basename(w.audio_path), "duration": w.duration}
+        folder = tempfile.mkdtemp(prefix="bench_annotations_")
+        try:
+            for ext in ("json", "npz"):
+                path = os.path.join(folder, f"annotations.{ext}")
+                file_params = dict(params, format=ext)
+                self.recorder.add("annotations_save", file_params,
+                                  timed(lambda: write_annotation_file(path, w.annotations, header), self.options.repeat),
+                                  bytes=os.path.getsize(path) if os.path.exists(path) else None)
+                self.recorder.add("annotations_load", file_params,
+                                  timed(lambda: w.annotation_model.load(path), self.options.repeat))
+        finally:
+            shutil.rmtree(folder, ignore_errors=True)
+
+    def close(self):
+        self.window.close()
+        self.process_events()
+
+
+def bench_playback(recorder, y, sr, params):
+    # Audio callback on the direct path and WSOLA hop production, both without an output device
+    from playback import PlaybackEngine
+    from stretch import Wsola
+    engine = PlaybackEngine()
+    engine.set_audio(y, sr)
+    n = min(len(y), int(PLAYBACK_SECONDS * sr))
+    with engine.lock:
+        engine.start, engine.end, engine.pos, engine.playing = 0, n, 0.0, True
+    out = np.zeros((engine.blocksize, 1), dtype=np.float32)
+    time_info = SimpleNamespace(outputBufferDacTime=0.0)
+    status = SimpleNamespace(output_underflow=False)
+    calls = []
+    while engine.playing:
+        t = time.perf_counter()
+        engine._callback(out, engine.blocksize, time_info, status)
+        calls.append(time.perf_counter() - t)
+    budget = engine.blocksize / sr
+    recorder.add("playback_callback", dict(params, block=engine.blocksize), calls,
+                 p99_s=float(np.percentile(calls, 99)), budget_s=budget)
+    for speed in (0.5, 1.5):
+        stretcher = Wsola(y, sr)
+        hops = []
+        while True:
+            t = time.perf_counter()
+            hop = stretcher.next_hop(speed, 0, n)
+            hops.append(time.perf_counter() - t)
+            if hop is None: break
+        hop_budget = stretcher.hop / sr
+        recorder.add("stretch_hop", dict(params, speed=speed), hops,
+                     p99_s=float(np.percentile(hops, 99)), budget_s=hop_budget)
+
+
+def dense_tile(samples, level, index):
+    # Reference for compute_tile: the whole tile span read at once and every window cut from it
+    from spectrogram import DB_RANGE, N_FFT, TILE_FRAMES, tile_span
+    first, last = tile_span(level, index)
+    segment = np.zeros(last - first + N_FFT, dtype=np.float32)
+    a, b = max(first - N_FFT // 2, 0), min(last + N_FFT // 2, len(samples))
+    segment[a - first + N_FFT // 2:b - first + N_FFT // 2] = samples[a:b]
+    offsets = (np.arange(TILE_FRAMES) << level)[:, None] + np.arange(N_FFT)
+    window = np.hanning(N_FFT).astype(np.float32)
+    spec = np.abs(np.fft.rfft(segment[offsets] * window, axis=1))
+    db = 20 * np.log10(spec / (window.sum() / 2) + 1e-10)
+    return np.clip((db + DB_RANGE) * (255 / DB_RANGE), 0, 255).astype(np.uint8)
+
+
+def bench_spectrogram(recorder, y, sr, params, repeat):
+    # One tile at the finest level and at the level that fits the whole file in view; the
+    # tiles on both sides of hop == N_FFT must match the dense reference
+    from spectrogram import MIN_LEVEL, N_FFT, compute_tile, level_for
+    for level in (MIN_LEVEL, int(np.log2(N_FFT)) + 1):
+        if not np.array_equal(compute_tile(y, level, 0), dense_tile(y, level, 0)):
+            raise RuntimeError(f"spectrogram tile at level {level} differs from the dense reference")
+    for level in sorted({MIN_LEVEL, level_for(len(y) / 1600)}):
+        recorder.add("spectrogram_tile", dict(params, level=level),
+                     timed(lambda: compute_tile(y, level, 0), repeat))
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="main.py bench",
+                                     description="Time loading, drawing, playback and annotation work on synthetic audio.")
+    parser.add_argument("--durations", default=",".join(f"{d:g}" for d in DURATIONS),
+                        help="comma-separated file lengths in seconds")
+    parser.add_argument("--channels", default=",".join(map(str, CHANNELS)), help="comma-separated channel counts")
+    parser.add_argument("--annotations", default=",".join(map(str, ANNOTATION_COUNTS)),
+                        help="comma-separated annotation counts")
+    parser.add_argument("--sr", type=int, default=22050)
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per step")
+    parser.add_argument("--only", default=None,
+                        help="comma-separated groups to run: decode, show, view, spectrogram, playback, annotations")
+    parser.add_argument("--out", default=OUTPUT_NAME, help=f"JSON-lines results, appended (default {OUTPUT_NAME})")
+    parser.add_argument("--label", default=None, help="name stored with every record of this run")
+    parser.add_argument("--data-dir", default=None, help="keep synthetic audio here between runs")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    options = parse_args(sys.argv[1:] if argv is None else argv)
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    groups = set((options.only or "decode,show,view,spectrogram,playback,annotations").split(","))
+    durations = [float(d) for d in options.durations.split(",")]
+    channels = [int(c) for c in options.channels.split(",")]
+    counts = [int(c) for c in options.annotations.split(",")]
+
+    from cache import DecodeCache
+    work = tempfile.mkdtemp(prefix="audio_labeler_bench_")
+    data_dir = options.data_dir or os.path.join(work, "audio")
+    os.makedirs(data_dir, exist_ok=True)
+    recorder = Recorder(options.out, options.label)
+    gui = None
+    try:
+        gui = GuiBench(recorder, options, os.path.join(work, "cache"))
+        for seconds in durations:
+            for ch in channels:
+                path = audio_file(data_dir, seconds, options.sr, ch)
+                params = {"duration_s": seconds, "channels": ch, "sr": options.sr}
+                if "decode" in groups:
+                    gui.decode(path, params)
+                store, sr, pyramid = gui.load(path, DecodeCache(gui.cache_root))
+                params["sample_bytes"] = store.nbytes
+                if "show" in groups:
+                    gui.show(path, store, sr, pyramid, params)
+                else:
+                    gui.window.show_audio(path, store, sr, pyramid)
+                if "view" in groups:
+                    gui.view(len(store) / sr, params)
+                if "spectrogram" in groups:
+                    bench_spectrogram(recorder, store.view(), sr, params, options.repeat)
+                if "playback" in groups:
+                    bench_playback(recorder, store.view(), sr, params)
+                # Annotation costs do not depend on the channel count
+                if "annotations" in groups and ch == channels[0]:
+                    for count in counts:
+                        gui.annotations(len(store) / sr, count, params)
+                gui.window.annotation_model.detach_journal()
+    finally:
+        if gui is not None:
+            gui.close()
+        recorder.close()
+        shutil.rmtree(work, ignore_errors=True)
+    print(f"Results appended to {options.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
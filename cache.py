@@ -0,0 +1,115 @@
+import os
+import json
+import shutil
+import hashlib
+import numpy as np
+from config import CACHE_DIR, CACHE_MAX_BYTES
+from peaks import PeakPyramid
+from samples import SampleStore
+
+CACHE_VERSION = 2
+
+
+class DecodeCache:
+    def __init__(self, root=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+
+    def key(self, path):
+        st = os.stat(path)
+        ident = f"{CACHE_VERSION}|{os.path.abspath(path)}|{st.st_size}|{st.st_mtime_ns}"
+        return hashlib.sha1(ident.encode("utf-8")).hexdigest()
+
+    def entry_dir(self, path):
+        return os.path.join(self.root, self.key(path))
+
+    def __contains__(self, path):
+        try:
+            return os.path.isfile(os.path.join(self.entry_dir(path), "meta.json"))
+        except OSError:
+            return False
+
+    def load(self, path):
+        try:
+            entry = self.entry_dir(path)
+            with open(os.path.join(entry, "meta.json"), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            data = np.load(os.path.join(entry, "samples.npy"), mmap_mode="r")
+            packed = np.load(os.path.join(entry, "peaks.npy"), mmap_mode="r")
+            store = SampleStore(data, meta["sr"], meta["layout"])
+        except (OSError, ValueError, KeyError):
+            return None
+        pyramid = PeakPyramid.unpack(packed, meta["peak_offsets"], meta["n_samples"], meta["min_level"])
+        os.utime(os.path.join(entry, "meta.json"))
+        return store, meta["sr"], pyramid
+
+    def store(self, path, samples, sr, pyramid, evict=True):
+        entry = self.entry_dir(path)
+        tmp = f"{entry}.tmp-{os.getpid()}"
+        try:
+            os.makedirs(tmp, exist_ok=True)
+            packed, offsets = pyramid.pack()
+            np.save(os.path.join(tmp, "samples.npy"), samples.data)
+            np.save(os.path.join(tmp, "peaks.npy"), packed)
+            meta = {
+                "source": os.path.abspath(path),
+                "sr": float(sr),
+                "n_samples": int(len(samples)),
+                "channels": samples.channels,
+                "layout": samples.layout,
+                "min_level": pyramid.min_level,
+                "peak_offsets": [int(o) for o in offsets],
+            }
+            with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+            if os.path.isdir(entry):
+                shutil.rmtree(entry, ignore_errors=True)
+            os.replace(tmp, entry)
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)
+            return
+        if evict:
+            self.evict(keep=entry)
+
+    def store_spectrogram(self, path, level, image):
+        # Precomputed spectrogram level kept next to the samples of an existing entry
+        entry = self.entry_dir(path)
+        target = os.path.join(entry, f"spectrogram-{level}.npy")
+        tmp = f"{target}.tmp-{os.getpid()}"
+        try:
+            with open(tmp, "wb") as f:
+                np.save(f, image)
+            os.replace(tmp, target)
+        except OSError:
+            if os.path.exists(tmp): os.remove(tmp)
+
+    def load_spectrogram(self, path):
+        try:
+            entry = self.entry_dir(path)
+            names = [n for n in os.listdir(entry) if n.startswith("spectrogram-") and n.endswith(".npy")]
+            return {int(n[12:-4]): np.load(os.path.join(entry, n), mmap_mode="r") for n in names}
+        except (OSError, ValueError):
+            return {}
+
+    def entries(self):
+        if not os.path.isdir(self.root): return []
+        result = []
+        for name in os.listdir(self.root):
+            entry = os.path.join(self.root, name)
+            meta = os.path.join(entry, "meta.json")
+            if not os.path.isfile(meta): continue
+            size = sum(e.stat().st_size for e in os.scandir(entry) if e.is_file())
+            result.append((os.path.getmtime(meta), size, entry))
+        return result
+
+    def evict(self, keep=None):
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in entries:
+            if total <= self.max_bytes: break
+            if entry == keep: continue
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+
+    def clear(self):
+        shutil.rmtree(self.root, ignore_errors=True)
@@ -1,3 +1,5 @@
+import os
+
 THEME = {
     "bg": "#1e1e1e",
     "fg": "#cccccc",
@@ -6,7 +8,26 @@ THEME = {
     "selection": (0, 255, 153, 40),   
     "zoom_selection": (255, 255, 0, 50), 
     "saved_region": (0, 122, 204, 80), 
+    "proposal": (255, 170, 0, 35),
+    "proposal_edge": "#ffaa00",
+    "overview_view": (255, 255, 255, 40),
     "list_bg": "#252526",
     "btn_bg": "#333333",
     "btn_hover": "#3e3e42"
-}
\ No newline at end of file
+}
+
+CACHE_DIR = os.environ.get("AUDIO_LABELER_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "audio_labeler"))
+CACHE_MAX_BYTES = 8 * 1024 ** 3
+SESSION_MEMORY_BYTES = 2 * 1024 ** 3
+SESSION_PREFETCH = 3
+# Decoded samples: "auto" keeps 16-bit sources as int16, "float32" or "int16" force one dtype;
+# channels are stored "planar" (one contiguous run per channel) or "interleaved"
+SAMPLE_STORAGE = os.environ.get("AUDIO_LABELER_SAMPLES", "auto")
+SAMPLE_LAYOUT = os.environ.get("AUDIO_LABELER_LAYOUT", "planar")
+# Opening a time range decodes this many seconds around it, then more as the view leaves the
+# decoded window; a window never grows past RANGE_MAX_SECONDS, it moves instead
+RANGE_MARGIN = 30.0
+RANGE_MAX_SECONDS = 30 * 60
+# Hot-path timers and counters; also switched on at runtime by the performance HUD (F3)
+PROFILE = os.environ.get("AUDIO_LABELER_PROFILE", "") not in ("", "0")
+TRACE_EVENTS = 200_000
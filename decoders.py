@@ -0,0 +1,107 @@
+import numpy as np
+import soundfile as sf
+from config import SAMPLE_LAYOUT, SAMPLE_STORAGE
+from samples import SampleStore, storage_dtype
+
+BLOCK_FRAMES = 1 << 18
+AUDIO_EXTENSIONS = (".wav", ".mp3", ".flac", ".ogg")
+
+
+class SoundFileDecoder:
+    def __init__(self, path):
+        self.file = sf.SoundFile(path)
+        self.sr = self.file.samplerate
+        self.frames = self.file.frames
+        self.channels = self.file.channels
+        self.subtype = self.file.subtype
+
+    def read_frames(self, frames, dtype='float32'):
+        # (frames, channels); int16 comes straight from the file without a float pass
+        return self.file.read(frames, dtype=np.dtype(dtype).name, always_2d=True)
+
+    def close(self):
+        self.file.close()
+
+
+class LibrosaDecoder:
+    def __init__(self, path, sr=None, offset=0.0, duration=None):
+        import librosa
+        y, self.sr = librosa.load(path, sr=sr, mono=False, offset=offset, duration=duration)
+        self.y = y[:, None] if y.ndim == 1 else y.T
+        self.frames = len(self.y)
+        self.channels = self.y.shape[1]
+        self.subtype = None
+        self.pos = 0
+
+    def read_frames(self, frames, dtype='float32'):
+        block = self.y[self.pos:self.pos + frames]
+        self.pos += len(block)
+        return block
+
+    def close(self):
+        self.y = None
+
+
+def open_decoder(path, sr=None):
+    if sr is None:
+        try:
+            return SoundFileDecoder(path)
+        except RuntimeError:
+            pass
+    else:
+        try:
+            with sf.SoundFile(path) as f:
+                if f.samplerate == sr:
+                    return SoundFileDecoder(path)
+        except RuntimeError:
+            pass
+    return LibrosaDecoder(path, sr=sr)
+
+
+def allocate_store(decoder, frames=None, storage=SAMPLE_STORAGE, layout=SAMPLE_LAYOUT):
+    dtype = storage_dtype(decoder.subtype, storage)
+    frames = decoder.frames if frames is None else frames
+    return SampleStore.allocate(frames, decoder.channels, decoder.sr, dtype, layout)
+
+
+def _fill(decoder, store):
+    filled = 0
+    while filled < len(store):
+        block = decoder.read_frames(min(BLOCK_FRAMES, len(store) - filled), store.dtype)
+        if len(block) == 0: break
+        store.write(filled, block)
+        filled += len(block)
+    return store.truncate(filled) if filled < len(store) else store
+
+
+def decode_store(path, sr=None):
+    # Whole-file decode of every channel into one preallocated store, for callers without
+    # progress reporting
+    decoder = open_decoder(path, sr=sr)
+    try:
+        return _fill(decoder, allocate_store(decoder)), decoder.sr
+    finally:
+        decoder.close()
+
+
+def decode_range(path, start, stop):
+    # Every channel of [start, stop) seconds only. soundfile seeks in the container; the
+    # librosa fallback is given the same offset and duration. Returns the store, the file
+    # position of its first frame and the length of the whole file, both in frames
+    try:
+        decoder = SoundFileDecoder(path)
+    except RuntimeError:
+        import librosa
+        decoder = LibrosaDecoder(path, offset=start, duration=stop - start)
+        first = int(round(start * decoder.sr))
+        total = max(first + decoder.frames, int(round(librosa.get_duration(path=path) * decoder.sr)))
+        frames = decoder.frames
+    else:
+        total = decoder.frames
+        first = min(max(0, int(start * decoder.sr)), total)
+        frames = min(max(first, int(stop * decoder.sr)), total) - first
+        decoder.file.seek(first)
+    try:
+        return _fill(decoder, allocate_store(decoder, frames)), decoder.sr, first, total
+    finally:
+        decoder.close()
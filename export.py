@@ -0,0 +1,194 @@
+import os
+import re
+import csv
+import sys
+import shutil
+import argparse
+import tempfile
+import multiprocessing
+from fractions import Fraction
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import soundfile as sf
+from annotations import AnnotationStore, read_annotation_file
+from cache import DecodeCache
+from config import CACHE_DIR
+from decoders import decode_store
+from peaks import PeakPyramid
+from samples import SampleStore
+
+FORMATS = {"wav": "WAV", "flac": "FLAC"}
+SEGMENTS_PER_TASK = 64
+MANIFEST_NAME = "manifest.csv"
+MANIFEST_FIELDS = ["path", "label", "source", "start", "end", "sr", "samples"]
+# "mix" writes mono clips of the channel mean, "all" keeps every channel of the source
+CHANNEL_MODES = ("mix", "all")
+
+
+def safe_name(label):
+    return re.sub(r'[^\w\-. ]+', '_', label).strip(" .") or "unlabeled"
+
+
+def prepare_source(path, cache_root, spill_path):
+    # Decodes path once for all of its segment tasks. A cache that will not take the entry
+    # (read-only or full) leaves the samples in spill_path instead; returns what open_source needs
+    cache = DecodeCache(cache_root)
+    if path in cache:
+        return None
+    store, sr = decode_store(path)
+    cache.store(path, store, sr, PeakPyramid(store.view()), evict=False)
+    if path in cache:
+        return None
+    np.save(spill_path, store.data)
+    return spill_path, sr, store.layout
+
+
+def open_source(path, cache_root, spilled=None):
+    # Memory-mapped samples from the decode cache or the spill file; never a second decode
+    if spilled is not None:
+        spill_path, sr, layout = spilled
+        return SampleStore(np.load(spill_path, mmap_mode="r"), sr, layout), sr
+    cached = DecodeCache(cache_root).load(path)
+    if not cached:
+        raise OSError(f"{path}: decoded samples left the cache during the export")
+    return cached[0], cached[1]
+
+
+def cut(y, sr, start, end, pad=0.0):
+    # Copies only [start - pad, end + pad) out of y, zero-filling past the ends of the file;
+    # y is a 1-D lane or a SampleStore, whose slices are (frames, channels)
+    a = int(round((start - pad) * sr))
+    b = int(round((end + pad) * sr))
+    clip = np.zeros((max(0, b - a),) + np.shape(y[0:0])[1:], dtype=np.float32)
+    lo, hi = max(a, 0), min(b, len(y))
+    if hi > lo:
+        clip[lo - a:hi - a] = y[lo:hi]
+    return clip
+
+
+def resample(clip, sr, target_sr):
+    from scipy.signal import resample_poly
+    ratio = Fraction(int(target_sr), int(sr)).limit_denominator(1000)
+    return resample_poly(clip, ratio.numerator, ratio.denominator, axis=0).astype(np.float32)
+
+
+def write_segments(source, stem, cache_root, segments, out_dir, fmt="wav", target_sr=None, pad=0.0, channels="mix",
+                   spilled=None):
+    # Runs in a worker process; segments are (index, start, end, label) and one manifest row comes back per clip
+    store, sr = open_source(source, cache_root, spilled)
+    y = store if channels == "all" else store.view()
+    rate = int(target_sr or sr)
+    rows = []
+    for index, start, end, label in segments:
+        clip = cut(y, sr, start, end, pad)
+        if rate != sr:
+            clip = resample(clip, sr, rate)
+        folder = safe_name(label)
+        name = f"{stem}_{index:05d}.{fmt}"
+        os.makedirs(os.path.join(out_dir, folder), exist_ok=True)
+        sf.write(os.path.join(out_dir, folder, name), clip, rate, format=FORMATS[fmt])
+        rows.append({"path": f"{folder}/{name}", "label": label, "source": source, "start": start,
+                     "end": end, "sr": rate, "samples": len(clip)})
+    return rows
+
+
+def export_clips(sources, out_dir, fmt="wav", target_sr=None, pad=0.0, jobs=None, cache_root=CACHE_DIR,
+                 progress=None, should_stop=None, channels="mix"):
+    # sources maps an audio path to its [(start, end, label), ...]; returns the number of clips written
+    os.makedirs(out_dir, exist_ok=True)
+    stems, seen = {}, {}
+    for source in sources:
+        stem = safe_name(os.path.splitext(os.path.basename(source))[0])
+        seen[stem] = seen.get(stem, 0) + 1
+        stems[source] = stem if seen[stem] == 1 else f"{stem}-{seen[stem]}"
+    total = sum(len(segments) for segments in sources.values())
+    rows = []
+    # Spawned workers: forking a process that runs Qt threads is not safe
+    context = multiprocessing.get_context("spawn")
+    spill_dir = tempfile.mkdtemp(prefix="export_samples_")
+    try:
+        with ProcessPoolExecutor(max_workers=jobs or os.cpu_count(), mp_context=context) as pool:
+            # Decode each source once, then cut its segments from memory-mapped samples
+            prepared = {source: pool.submit(prepare_source, source, cache_root, os.path.join(spill_dir, f"{i}.npy"))
+                        for i, source in enumerate(sources)}
+            spilled = {source: future.result() for source, future in prepared.items()}
+            futures = []
+            for source, segments in sources.items():
+                indexed = [(i, s, e, label) for i, (s, e, label) in enumerate(segments)]
+                for a in range(0, len(indexed), SEGMENTS_PER_TASK):
+                    futures.append(pool.submit(write_segments, source, stems[source], cache_root,
+                                               indexed[a:a + SEGMENTS_PER_TASK], out_dir, fmt, target_sr, pad,
+                                               channels, spilled[source]))
+            for future in as_completed(futures):
+                if should_stop and should_stop():
+                    for f in futures: f.cancel()
+                    break
+                rows.extend(future.result())
+                if progress: progress(len(rows), total)
+    finally:
+        shutil.rmtree(spill_dir, ignore_errors=True)
+    DecodeCache(cache_root).evict()
+    rows.sort(key=lambda row: row["path"])
+    with open(os.path.join(out_dir, MANIFEST_NAME), 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=MANIFEST_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+    return len(rows)
+
+
+def store_segments(store):
+    labels = store.labels
+    return [(s, e, labels[i]) for s, e, i in zip(store.starts.tolist(), store.ends.tolist(), store.label_ids.tolist())]
+
+
+def read_sources(annotation_paths, audio_dir=None):
+    # The audio file is looked up by the "file" name stored in each annotation file
+    sources = {}
+    for path in annotation_paths:
+        store = AnnotationStore()
+        meta = read_annotation_file(path, store)
+        if not meta.get("file"):
+            raise ValueError(f"{path}: no audio file name recorded")
+        audio = os.path.join(audio_dir or os.path.dirname(os.path.abspath(path)), meta["file"])
+        if not os.path.isfile(audio):
+            raise FileNotFoundError(f"{path}: audio file {audio} not found")
+        sources.setdefault(audio, []).extend(store_segments(store))
+    return sources
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="main.py export", description="Cut labelled segments into per-label clip folders.")
+    parser.add_argument("annotations", nargs="+", help="annotation files (.json or .npz)")
+    parser.add_argument("--out", "-o", required=True, help="output directory")
+    parser.add_argument("--format", choices=sorted(FORMATS), default="wav")
+    parser.add_argument("--sr", type=int, default=None, help="resample clips to this rate")
+    parser.add_argument("--pad", type=float, default=0.0, help="seconds of context added on both sides")
+    parser.add_argument("--channels", choices=CHANNEL_MODES, default="mix",
+                        help="mono mix of the source, or all of its channels")
+    parser.add_argument("--jobs", "-j", type=int, default=os.cpu_count() or 1, help="worker processes")
+    parser.add_argument("--audio-dir", default=None, help="folder with the audio files (default: next to each annotation file)")
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    options = parse_args(sys.argv[1:] if argv is None else argv)
+    try:
+        sources = read_sources(options.annotations, options.audio_dir)
+    except (OSError, ValueError, KeyError) as e:
+        print(e)
+        return 1
+    total = sum(len(s) for s in sources.values())
+    print(f"Exporting {total} segments from {len(sources)} files with {options.jobs} jobs")
+
+    def report(done, total):
+        print(f"\r{done}/{total}", end="", flush=True)
+
+    count = export_clips(sources, options.out, options.format, options.sr, options.pad, options.jobs,
+                         options.cache_dir, progress=report, channels=options.channels)
+    print(f"\nWrote {count} clips and {os.path.join(options.out, MANIFEST_NAME)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,140 @@
+import json
+import time
+import threading
+import functools
+import collections
+from config import PROFILE, TRACE_EVENTS
+
+# Checked on every call; when off a span is a shared no-op and costs one attribute lookup
+enabled = PROFILE
+
+_origin = time.perf_counter_ns()
+_events = collections.deque(maxlen=TRACE_EVENTS)
+_stats = {}
+_counters = collections.Counter()
+_threads = {}
+_lock = threading.Lock()
+
+
+def enable(on=True):
+    global enabled
+    enabled = on
+
+
+class _Span:
+    __slots__ = ("name", "args", "start")
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        _record("X", self.name, self.start, time.perf_counter_ns() - self.start, self.args)
+        return False
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+def span(name, **args):
+    return _Span(name, args or None) if enabled else _NO_SPAN
+
+
+def timed(name):
+    def wrap(fn):
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            if not enabled:
+                return fn(*args, **kwargs)
+            with _Span(name, None):
+                return fn(*args, **kwargs)
+        return inner
+    return wrap
+
+
+def sample(name, value_ns):
+    # A measured interval that is not a span, such as timer jitter
+    if enabled:
+        _record("C", name, time.perf_counter_ns(), value_ns, None)
+
+
+def count(name, n=1):
+    if not enabled: return
+    with _lock:
+        _counters[name] += n
+        total = _counters[name]
+    _events.append(("C", name, time.perf_counter_ns(), total, _thread(), None))
+
+
+def _thread():
+    tid = threading.get_ident()
+    if tid not in _threads:
+        _threads[tid] = threading.current_thread().name
+    return tid
+
+
+def _record(kind, name, start_ns, value_ns, args):
+    _events.append((kind, name, start_ns, value_ns, _thread(), args))
+    with _lock:
+        stat = _stats.get(name)
+        if stat is None:
+            stat = _stats[name] = [0, 0, 0, 0]
+        stat[0] += 1
+        stat[1] += value_ns
+        stat[2] = max(stat[2], value_ns)
+        stat[3] = value_ns
+
+
+def snapshot():
+    # ({name: (count, total_ns, peak_ns, last_ns)}, {counter: total})
+    with _lock:
+        return {name: tuple(stat) for name, stat in _stats.items()}, dict(_counters)
+
+
+def reset_peaks():
+    with _lock:
+        for stat in _stats.values():
+            stat[2] = 0
+
+
+def clear():
+    with _lock:
+        _events.clear()
+        _stats.clear()
+        _counters.clear()
+
+
+def export_trace(path):
+    # Chrome trace event format, opened by chrome://tracing and Perfetto; holds the last
+    # TRACE_EVENTS events only
+    pid = 1
+    trace = [{"ph": "M", "name": "thread_name", "pid": pid, "tid": tid, "args": {"name": name}}
+             for tid, name in list(_threads.items())]
+    for kind, name, start, value, tid, args in list(_events):
+        ts = (start - _origin) / 1000
+        if kind == "X":
+            event = {"ph": "X", "name": name, "ts": ts, "dur": value / 1000, "pid": pid, "tid": tid}
+            if args:
+                event["args"] = args
+        elif name in _counters:
+            event = {"ph": "C", "name": name, "ts": ts, "pid": pid, "tid": tid, "args": {"total": value}}
+        else:
+            event = {"ph": "C", "name": name, "ts": ts, "pid": pid, "tid": tid, "args": {"ms": value / 1e6}}
+        trace.append(event)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({"traceEvents": trace, "displayTimeUnit": "ms"}, f)
+    return len(trace)
@@ -0,0 +1,140 @@
+import os
+import json
+import time
+import queue
+import threading
+from annotations import read_json, write_json
+
+JOURNAL_SUFFIX = ".annotations.journal"
+SNAPSHOT_SUFFIX = ".annotations.autosave.json"
+FSYNC_INTERVAL = 0.5
+COMPACT_EVERY = 1000
+
+
+class AnnotationJournal:
+    def __init__(self, audio_path, duration=0):
+        self.audio_path = audio_path
+        self.duration = duration
+        self.journal_path = audio_path + JOURNAL_SUFFIX
+        self.snapshot_path = audio_path + SNAPSHOT_SUFFIX
+        self.seq = 0
+        self.since_compact = 0
+        self.error = None
+        self.queue = queue.Queue()
+        self.thread = None
+
+    def recover(self, store):
+        # Snapshot first, then every journal record newer than it; a torn last line is dropped
+        base_seq = 0
+        if os.path.exists(self.snapshot_path):
+            base_seq = read_json(self.snapshot_path, store).get("journal_seq", 0)
+        self.seq = base_seq
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break
+                    if record["seq"] <= base_seq: continue
+                    self.apply(store, record)
+                    self.seq = record["seq"]
+                    self.since_compact += 1
+        return len(store)
+
+    @staticmethod
+    def apply(store, record):
+        op = record["op"]
+        if op == "add":
+            store.add(record["start"], record["end"], record["label"])
+            return
+        row = store.find(record["start"], record["end"], record["label"])
+        if row is None: return
+        if op == "remove":
+            store.remove(row)
+        elif op == "relabel":
+            store.set_label(row, record["new"])
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def close(self, store=None):
+        if self.thread is None: return
+        if store is not None and self.since_compact:
+            self.compact(store)
+        self.queue.put(None)
+        self.thread.join()
+        self.thread = None
+
+    def _record(self, **record):
+        self.seq += 1
+        self.since_compact += 1
+        record["seq"] = self.seq
+        self.queue.put(("record", json.dumps(record)))
+
+    def record_add(self, start, end, label):
+        self._record(op="add", start=start, end=end, label=label)
+
+    def record_remove(self, start, end, label):
+        self._record(op="remove", start=start, end=end, label=label)
+
+    def record_relabel(self, start, end, label, new):
+        self._record(op="relabel", start=start, end=end, label=label, new=new)
+
+    @property
+    def dirty(self):
+        return self.since_compact > 0
+
+    def needs_compaction(self):
+        return self.since_compact >= COMPACT_EVERY
+
+    def compact(self, store):
+        # Copies are cheap array slices; the JSON is built on the writer thread
+        snapshot = (self.seq, store.starts.copy(), store.ends.copy(), store.label_ids.copy(), list(store.labels))
+        self.since_compact = 0
+        self.queue.put(("compact", snapshot))
+
+    def _run(self):
+        # The journal file is only created once there is something to write
+        f = None
+        try:
+            while True:
+                items = [self.queue.get()]
+                while True:
+                    try:
+                        items.append(self.queue.get_nowait())
+                    except queue.Empty:
+                        break
+                for item in items:
+                    if item is None:
+                        return
+                    kind, payload = item
+                    if kind == "record":
+                        if f is None:
+                            f = open(self.journal_path, 'a', encoding='utf-8')
+                        f.write(payload + "\n")
+                    else:
+                        self._write_snapshot(*payload)
+                        if f is not None:
+                            f.close()
+                            f = None
+                        if os.path.exists(self.journal_path):
+                            open(self.journal_path, 'w').close()
+                if f is not None:
+                    f.flush()
+                    os.fsync(f.fileno())
+                time.sleep(FSYNC_INTERVAL)
+        except OSError as e:
+            self.error = str(e)
+        finally:
+            if f is not None:
+                f.flush()
+                os.fsync(f.fileno())
+                f.close()
+
+    def _write_snapshot(self, seq, starts, ends, label_ids, labels):
+        header = {"file": os.path.basename(self.audio_path), "duration": self.duration, "journal_seq": seq}
+        tmp = self.snapshot_path + ".tmp"
+        write_json(tmp, starts, ends, label_ids, labels, header, indent=None, sync=True)
+        os.replace(tmp, self.snapshot_path)
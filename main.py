@@ -1,19 +1,56 @@
 import sys
-import pyqtgraph as pg
-from PyQt6.QtWidgets import QApplication
-from mainwindow import AudioLabeler
+import argparse
+import importlib
 
-try:
-    pg.setConfigOptions(useOpenGL=True)
-    pg.setConfigOptions(enableExperimental=True)
-except Exception as e:
-    print(f"OpenGL warning: {e}")
+# Headless commands, dispatched before the GUI imports Qt
+COMMANDS = ("batch", "export", "bench")
 
-pg.setConfigOptions(antialias=False)
 
-if __name__ == "__main__":
+def parse_args(argv):
+    from models import parse_span
+
+    def span(text):
+        try:
+            return parse_span(text)
+        except ValueError as e:
+            raise argparse.ArgumentTypeError(str(e))
+
+    parser = argparse.ArgumentParser(prog="main.py", description=f"Audio labeller. Headless commands: {', '.join(COMMANDS)}.")
+    parser.add_argument("audio", nargs="?", help="audio file to open")
+    parser.add_argument("--range", dest="span", type=span, metavar="START-END",
+                        help="open only this part of the file, e.g. 1:30:00-1:35:00; more is decoded while panning")
+    # Anything else is left to Qt
+    options, _ = parser.parse_known_args(argv)
+    if options.span and not options.audio:
+        parser.error("--range needs an audio file")
+    return options
+
+
+def run_gui(argv):
+    import pyqtgraph as pg
+    from PyQt6.QtWidgets import QApplication
+    from mainwindow import AudioLabeler
+
+    options = parse_args(argv)
+    try:
+        pg.setConfigOptions(useOpenGL=True)
+        pg.setConfigOptions(enableExperimental=True)
+    except Exception as e:
+        print(f"OpenGL warning: {e}")
+
+    pg.setConfigOptions(antialias=False)
+
     app = QApplication(sys.argv)
     app.setStyle("Fusion")
     window = AudioLabeler()
     window.show()
-    sys.exit(app.exec())
\ No newline at end of file
+    if options.audio:
+        window.open_audio(options.audio, options.span)
+    return app.exec()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] in COMMANDS:
+        command = importlib.import_module(sys.argv[1])
+        sys.exit(command.main(sys.argv[2:]))
+    sys.exit(run_gui(sys.argv[1:]))
@@ -1,13 +1,22 @@
 import os
-import json
 import time
 import numpy as np
-import sounddevice as sd
 import pyqtgraph as pg
 from PyQt6 import QtWidgets, QtCore, QtGui
-from config import THEME
-from workers import AudioLoaderThread
-from widgets import CustomPlotWidget, TimeAxisItem
+import instrument
+from config import PROFILE, RANGE_MARGIN, RANGE_MAX_SECONDS, THEME
+from annotations import AnnotationStore, write_annotation_file
+from cache import DecodeCache
+from export import store_segments
+from journal import AnnotationJournal
+from models import AnnotationFilterProxy, AnnotationTableModel, format_time, parse_span
+from peaks import PeakPyramid
+from playback import PlaybackEngine
+from proposals import detect
+from session import FileSession
+from workers import AudioLoaderThread, ExportThread, ProposalEngine, RangeLoaderThread
+from widgets import (AnnotationItem, CursorItem, CustomPlotWidget, OverviewItem, PerformanceHud, SpectrogramItem,
+                     TimeAxisItem, ViewScheduler, WaveformItem)
 
 class AudioLabeler(QtWidgets.QMainWindow):
     def __init__(self):
@@ -19,19 +28,63 @@ class AudioLabeler(QtWidgets.QMainWindow):
         self.setWindowIcon(app_icon)
 
         self.audio_path = None
+        # Every channel lives in the store; y is the lane on screen (one channel or the mix)
+        self.store = None
+        self.channel = None
+        self.lane_pyramids = {}
         self.y = None
         self.sr = None
+        self.pyramid = None
+        # A time-range open keeps only a window of the file; offset is its first sample and
+        # total_frames the length of the whole file
+        self.ranged = False
+        self.range_span = None
+        self.range_thread = None
+        self.offset = 0
+        self.total_frames = 0
         self.duration = 0
-        self.annotations = [] 
-        self.region_items = []
+        self.annotations = AnnotationStore()
+        self.annotation_model = AnnotationTableModel(self.annotations)
+        self.proposals = AnnotationStore()
+        self.proposal_engine = ProposalEngine()
+        self.last_label = None
         self.loader_thread = None
+        self.export_thread = None
+        self.decode_cache = DecodeCache()
+        self.session = FileSession(self.decode_cache)
+        self.pending_path = None
         self.is_playing = False
-        self.play_start_time = 0
-        self.play_offset = 0
+        self.player = PlaybackEngine()
         
+        # Playback cursor follows the display refresh rate
         self.play_timer = QtCore.QTimer()
-        self.play_timer.setInterval(33) 
+        self.play_timer.setTimerType(QtCore.Qt.TimerType.PreciseTimer)
+        self.play_timer.setInterval(ViewScheduler.frame_interval())
         self.play_timer.timeout.connect(self.update_cursor_animation)
+        self.last_tick = None
+        self.reported_underruns = 0
+
+        self.autosave_timer = QtCore.QTimer()
+        self.autosave_timer.setInterval(60000)
+        self.autosave_timer.timeout.connect(self.compact_journal)
+        self.autosave_timer.start()
+
+        # Coalesces feature updates and threshold edits into one detection pass
+        self.proposal_timer = QtCore.QTimer()
+        self.proposal_timer.setSingleShot(True)
+        self.proposal_timer.setInterval(200)
+        self.proposal_timer.timeout.connect(self.refresh_proposals)
+        # "Only in view" follows the plot once a pan or zoom gesture settles, not every frame
+        self.list_window_timer = QtCore.QTimer()
+        self.list_window_timer.setSingleShot(True)
+        self.list_window_timer.setInterval(150)
+        self.list_window_timer.timeout.connect(self.update_list_time_window)
+        self.proposal_engine.updated.connect(self.on_proposals_updated)
+
+        self.hud_timer = QtCore.QTimer()
+        self.hud_timer.setInterval(500)
+        self.hud_timer.timeout.connect(self.update_hud)
+        self.hud_last = None
 
         self.init_style()
         self.init_ui()
@@ -70,8 +123,10 @@ class AudioLabeler(QtWidgets.QMainWindow):
                 padding: 4px;
                 border-radius: 4px;
             }}
-            QListWidget {{ background-color: {THEME['list_bg']}; border: 1px solid #444; font-family: 'Consolas'; }}
-            QListWidget::item:selected {{ background-color: #0078d7; }}
+            QTableView {{ background-color: {THEME['list_bg']}; border: 1px solid #444; font-family: 'Consolas'; gridline-color: #333; }}
+            QTableView::item:selected {{ background-color: #0078d7; }}
+            QHeaderView::section {{ background-color: {THEME['btn_bg']}; color: {THEME['fg']}; border: none; padding: 2px 4px; }}
+            QLineEdit {{ background-color: {THEME['btn_bg']}; color: white; border: 1px solid #444; padding: 3px; border-radius: 4px; }}
             QProgressBar {{ border: 1px solid #444; text-align: center; min-width: 200px; color: white; }}
             QProgressBar::chunk {{ background-color: #007acc; }}
             QLabel {{ color: {THEME['fg']}; }}
@@ -95,20 +150,47 @@ class AudioLabeler(QtWidgets.QMainWindow):
         btn_open = QtWidgets.QPushButton(" OPEN AUDIO")
         btn_open.setIcon(icon_open)
         btn_open.clicked.connect(self.load_audio_start)
+        btn_open.setToolTip("Ctrl+Shift+O opens only a time range of a long file")
         
         btn_save = QtWidgets.QPushButton(" SAVE (Ctrl+S)")
         btn_save.setIcon(icon_save)
         btn_save.clicked.connect(self.save_annotations)
         
+        btn_session = QtWidgets.QPushButton(" OPEN FOLDER")
+        btn_session.setIcon(self.style().standardIcon(QtWidgets.QStyle.StandardPixmap.SP_DirOpenIcon))
+        session_menu = QtWidgets.QMenu(btn_session)
+        session_menu.addAction("Folder...", self.open_session_folder)
+        session_menu.addAction("Manifest...", self.open_session_manifest)
+        btn_session.setMenu(session_menu)
+
+        self.btn_next_file = QtWidgets.QPushButton(" NEXT FILE")
+        self.btn_next_file.setIcon(self.style().standardIcon(QtWidgets.QStyle.StandardPixmap.SP_MediaSkipForward))
+        self.btn_next_file.setEnabled(False)
+        self.btn_next_file.clicked.connect(self.next_file)
+
+        btn_export = QtWidgets.QPushButton(" EXPORT CLIPS")
+        btn_export.setIcon(self.style().standardIcon(QtWidgets.QStyle.StandardPixmap.SP_DriveHDIcon))
+        btn_export.clicked.connect(self.export_clips)
+
         btn_load_json = QtWidgets.QPushButton(" LOAD JSON")
         btn_load_json.setIcon(icon_load)
         btn_load_json.clicked.connect(self.load_annotations_from_file)
 
         tools.addWidget(btn_open)
+        tools.addWidget(btn_session)
+        tools.addWidget(self.btn_next_file)
         tools.addWidget(btn_load_json)
         tools.addWidget(btn_save)
+        tools.addWidget(btn_export)
         
         tools.addSpacing(20)
+        tools.addWidget(QtWidgets.QLabel("Channel:"))
+        self.combo_channel = QtWidgets.QComboBox()
+        self.combo_channel.addItem("Mix")
+        self.combo_channel.setEnabled(False)
+        self.combo_channel.currentIndexChanged.connect(self.on_channel_changed)
+        tools.addWidget(self.combo_channel)
+
         tools.addWidget(QtWidgets.QLabel("Speed:"))
         
         self.spin_speed = QtWidgets.QDoubleSpinBox()
@@ -120,6 +202,39 @@ class AudioLabeler(QtWidgets.QMainWindow):
         self.spin_speed.valueChanged.connect(self.on_speed_changed)
         
         tools.addWidget(self.spin_speed)
+
+        self.chk_loop = QtWidgets.QCheckBox("Loop")
+        self.chk_loop.toggled.connect(self.on_loop_toggled)
+        tools.addWidget(self.chk_loop)
+
+        self.chk_spectrogram = QtWidgets.QCheckBox("Spectrogram")
+        self.chk_spectrogram.setChecked(True)
+        self.chk_spectrogram.toggled.connect(self.on_spectrogram_toggled)
+        tools.addWidget(self.chk_spectrogram)
+
+        self.chk_proposals = QtWidgets.QCheckBox("Proposals (A)")
+        self.chk_proposals.toggled.connect(self.on_proposals_toggled)
+        self.spin_threshold = QtWidgets.QDoubleSpinBox()
+        self.spin_threshold.setRange(1.0, 60.0)
+        self.spin_threshold.setValue(12.0)
+        self.spin_threshold.setSuffix(" dB")
+        self.spin_threshold.setToolTip("Level above the noise floor")
+        self.spin_threshold.valueChanged.connect(self.schedule_proposals)
+        self.spin_min_duration = QtWidgets.QDoubleSpinBox()
+        self.spin_min_duration.setRange(0.02, 10.0)
+        self.spin_min_duration.setSingleStep(0.05)
+        self.spin_min_duration.setValue(0.2)
+        self.spin_min_duration.setSuffix(" s")
+        self.spin_min_duration.setToolTip("Shortest proposed segment")
+        self.spin_min_duration.valueChanged.connect(self.schedule_proposals)
+        self.chk_snap = QtWidgets.QCheckBox("Snap")
+        self.chk_snap.setChecked(True)
+        self.chk_snap.setToolTip("Snap selection edges to onsets and zero crossings (hold Shift to drag freely)")
+        self.chk_snap.toggled.connect(self.on_snap_toggled)
+        tools.addWidget(self.chk_snap)
+        tools.addWidget(self.chk_proposals)
+        tools.addWidget(self.spin_threshold)
+        tools.addWidget(self.spin_min_duration)
         tools.addStretch()
 
         self.combo_mode = QtWidgets.QComboBox()
@@ -158,7 +273,7 @@ class AudioLabeler(QtWidgets.QMainWindow):
         self.btn_add.clicked.connect(self.add_annotation_from_selection)
 
         icon_size = QtCore.QSize(18, 18)
-        for btn in [btn_open, btn_save, btn_load_json, self.btn_play, self.btn_pause, self.btn_stop, self.btn_add]:
+        for btn in [btn_open, btn_session, self.btn_next_file, btn_save, btn_export, btn_load_json, self.btn_play, self.btn_pause, self.btn_stop, self.btn_add]:
             btn.setIconSize(icon_size)
 
         tools.addWidget(self.btn_play)
@@ -183,30 +298,25 @@ class AudioLabeler(QtWidgets.QMainWindow):
 
         self.plot_widget.sig_clicked.connect(self.on_plot_clicked)
         self.plot_widget.sig_saved_clicked.connect(self.on_saved_region_clicked)
-        
-        self.plot_widget.setDownsampling(ds=True, auto=True, mode='peak')
-        self.plot_widget.setClipToView(True) 
         self.plot_widget.getPlotItem().hideButtons()
 
-        self.curve = self.plot_widget.plot(pen=pg.mkPen(THEME['plot_line'], width=1))
-        self.curve.setSkipFiniteCheck(True)
+        self.curve = WaveformItem(THEME['plot_line'])
         self.curve.setZValue(1)
+        self.plot_widget.addItem(self.curve)
 
-        self.cursor_line = pg.InfiniteLine(pos=0, angle=90, pen=pg.mkPen(THEME['cursor'], width=2))
-        self.cursor_line.setZValue(20)
-        self.plot_widget.addItem(self.cursor_line)
-
-        marker_pen = pg.mkPen(THEME['cursor'])
-        marker_brush = pg.mkBrush(THEME['cursor'])
-        self.cursor_top = pg.ScatterPlotItem(size=14, symbol='o', pen=marker_pen, brush=marker_brush)
-        self.cursor_top.setZValue(21)
-        self.plot_widget.addItem(self.cursor_top)
+        self.annotation_item = AnnotationItem(self.annotations)
+        self.annotation_item.setZValue(5)
+        self.plot_widget.addItem(self.annotation_item)
+        self.plot_widget.annotation_item = self.annotation_item
 
-        self.cursor_bottom = pg.ScatterPlotItem(size=14, symbol='o', pen=marker_pen, brush=marker_brush)
-        self.cursor_bottom.setZValue(21)
-        self.plot_widget.addItem(self.cursor_bottom)
+        self.proposal_item = AnnotationItem(self.proposals, brush=THEME['proposal'], pen=THEME['proposal_edge'], labels=False)
+        self.proposal_item.setZValue(4)
+        self.proposal_item.setVisible(False)
+        self.plot_widget.addItem(self.proposal_item)
 
-        self.plot_widget.getViewBox().sigRangeChanged.connect(self.update_cursor_markers)
+        self.cursor_line = CursorItem(THEME['cursor'])
+        self.cursor_line.setZValue(20)
+        self.plot_widget.addItem(self.cursor_line)
 
         self.selection_region = pg.LinearRegionItem(values=(0, 0), brush=pg.mkBrush(THEME['selection']))
         self.selection_region.setZValue(10)
@@ -214,21 +324,103 @@ class AudioLabeler(QtWidgets.QMainWindow):
         self.plot_widget.selection_item = self.selection_region
 
         layout.addWidget(self.plot_widget, stretch=4)
+        self.hud = PerformanceHud(self.plot_widget)
+
+        self.overview_widget = pg.PlotWidget()
+        self.overview_widget.setBackground(THEME['bg'])
+        self.overview_widget.setFixedHeight(64)
+        overview_plot = self.overview_widget.getPlotItem()
+        overview_plot.hideAxis('left')
+        overview_plot.hideAxis('bottom')
+        overview_plot.hideButtons()
+        overview_plot.setMenuEnabled(False)
+        overview_plot.setMouseEnabled(x=False, y=False)
+        self.overview_widget.setYRange(-1.6, 1.0, padding=0)
+        self.overview = OverviewItem(THEME['plot_line'], THEME['saved_region'])
+        self.overview_widget.addItem(self.overview)
+        self.overview_region = pg.LinearRegionItem(values=(0, 0), brush=pg.mkBrush(THEME['overview_view']))
+        self.overview_region.setZValue(10)
+        self.overview_widget.addItem(self.overview_region)
+        self.overview_syncing = False
+        self.overview_region.sigRegionChanged.connect(self.on_overview_region_changed)
+        self.overview_widget.scene().sigMouseClicked.connect(self.on_overview_clicked)
+        self.plot_widget.getViewBox().sigXRangeChanged.connect(self.update_overview_region)
+        layout.addWidget(self.overview_widget)
+
+        self.spec_widget = pg.PlotWidget()
+        self.spec_widget.setBackground(THEME['bg'])
+        spec_plot = self.spec_widget.getPlotItem()
+        spec_plot.hideAxis('left')
+        spec_plot.hideAxis('bottom')
+        spec_plot.hideButtons()
+        spec_plot.setMenuEnabled(False)
+        spec_plot.setMouseEnabled(x=False, y=False)
+        self.spec_widget.setXLink(self.plot_widget)
+        self.spectrogram = SpectrogramItem()
+        self.spec_widget.addItem(self.spectrogram)
+        layout.addWidget(self.spec_widget, stretch=2)
 
         layout.addWidget(QtWidgets.QLabel("ANNOTATIONS:"))
-        self.list_widget = QtWidgets.QListWidget()
-        self.list_widget.setContextMenuPolicy(QtCore.Qt.ContextMenuPolicy.CustomContextMenu)
-        self.list_widget.customContextMenuRequested.connect(self.show_context_menu)
-        self.list_widget.itemDoubleClicked.connect(self.on_list_double_click)
-        layout.addWidget(self.list_widget, stretch=1)
+        list_tools = QtWidgets.QHBoxLayout()
+        self.edit_filter = QtWidgets.QLineEdit()
+        self.edit_filter.setPlaceholderText("Filter by label...")
+        self.edit_filter.textChanged.connect(self.on_filter_changed)
+        self.chk_in_view = QtWidgets.QCheckBox("Only in view")
+        self.chk_in_view.toggled.connect(self.update_list_time_window)
+        list_tools.addWidget(self.edit_filter)
+        list_tools.addWidget(self.chk_in_view)
+        layout.addLayout(list_tools)
+
+        self.annotation_proxy = AnnotationFilterProxy()
+        self.annotation_proxy.setSourceModel(self.annotation_model)
+        self.annotation_view = QtWidgets.QTableView()
+        self.annotation_view.setModel(self.annotation_proxy)
+        self.annotation_view.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectionBehavior.SelectRows)
+        self.annotation_view.setSelectionMode(QtWidgets.QAbstractItemView.SelectionMode.SingleSelection)
+        self.annotation_view.setEditTriggers(QtWidgets.QAbstractItemView.EditTrigger.EditKeyPressed)
+        self.annotation_view.setSortingEnabled(True)
+        self.annotation_view.sortByColumn(-1, QtCore.Qt.SortOrder.AscendingOrder)
+        self.annotation_view.horizontalHeader().setStretchLastSection(True)
+        self.annotation_view.verticalHeader().setSectionResizeMode(QtWidgets.QHeaderView.ResizeMode.Fixed)
+        self.annotation_view.verticalHeader().setDefaultSectionSize(20)
+        self.annotation_view.setContextMenuPolicy(QtCore.Qt.ContextMenuPolicy.CustomContextMenu)
+        self.annotation_view.customContextMenuRequested.connect(self.show_context_menu)
+        self.annotation_view.doubleClicked.connect(self.on_list_double_click)
+        layout.addWidget(self.annotation_view, stretch=1)
+
+        for sig in (self.annotation_model.rowsInserted, self.annotation_model.rowsRemoved,
+                    self.annotation_model.modelReset, self.annotation_model.dataChanged):
+            sig.connect(self.annotation_item.refresh)
+            sig.connect(self.schedule_proposals)
+            sig.connect(self.schedule_overview_density)
+        self.plot_widget.getViewBox().sigXRangeChanged.connect(self.schedule_list_time_window)
+        self.plot_widget.getViewBox().sigXRangeChanged.connect(
+            lambda: self.plot_widget.scheduler.request('range', self.extend_range))
+
+        self.file_list = QtWidgets.QListWidget()
+        self.file_list.setMinimumWidth(180)
+        self.file_list.itemActivated.connect(self.on_file_activated)
+        self.file_dock = QtWidgets.QDockWidget("FILES", self)
+        self.file_dock.setWidget(self.file_list)
+        self.file_dock.setVisible(False)
+        self.addDockWidget(QtCore.Qt.DockWidgetArea.LeftDockWidgetArea, self.file_dock)
+        self.session.ready.connect(self.on_file_prefetched)
+        self.session.failed.connect(self.on_file_prefetch_failed)
+        self.session.progress.connect(self.on_file_prefetch_progress)
 
         self.lbl_status = QtWidgets.QLabel("Ready")
         self.progress_bar = QtWidgets.QProgressBar()
         self.progress_bar.setVisible(False)
-        self.progress_bar.setRange(0, 0)
+        self.progress_bar.setRange(0, 100)
+
+        self.btn_cancel_load = QtWidgets.QPushButton(" CANCEL")
+        self.btn_cancel_load.setIcon(self.style().standardIcon(QtWidgets.QStyle.StandardPixmap.SP_DialogCancelButton))
+        self.btn_cancel_load.setVisible(False)
+        self.btn_cancel_load.clicked.connect(self.cancel_loading)
         
         self.statusBar().addWidget(self.lbl_status)
         self.statusBar().addPermanentWidget(self.progress_bar)
+        self.statusBar().addPermanentWidget(self.btn_cancel_load)
 
     def init_shortcuts(self):
         QtGui.QShortcut(QtGui.QKeySequence("Space"), self).activated.connect(self.toggle_play_pause)
@@ -236,6 +428,117 @@ class AudioLabeler(QtWidgets.QMainWindow):
         QtGui.QShortcut(QtGui.QKeySequence("Enter"), self).activated.connect(self.btn_add.click)
         QtGui.QShortcut(QtGui.QKeySequence("Delete"), self).activated.connect(self.delete_selected_annotation)
         QtGui.QShortcut(QtGui.QKeySequence("Ctrl+S"), self).activated.connect(self.save_annotations)
+        QtGui.QShortcut(QtGui.QKeySequence("Ctrl+Shift+O"), self).activated.connect(self.load_audio_range_start)
+        QtGui.QShortcut(QtGui.QKeySequence("Ctrl+Right"), self).activated.connect(self.select_next_annotation)
+        QtGui.QShortcut(QtGui.QKeySequence("Ctrl+Left"), self).activated.connect(self.select_previous_annotation)
+        QtGui.QShortcut(QtGui.QKeySequence("A"), self).activated.connect(self.accept_proposal)
+        QtGui.QShortcut(QtGui.QKeySequence("Ctrl+PgDown"), self).activated.connect(self.next_file)
+        QtGui.QShortcut(QtGui.QKeySequence("Ctrl+PgUp"), self).activated.connect(self.previous_file)
+        QtGui.QShortcut(QtGui.QKeySequence("F3"), self).activated.connect(self.toggle_hud)
+        QtGui.QShortcut(QtGui.QKeySequence("Ctrl+Shift+E"), self).activated.connect(self.export_trace)
+
+    def closeEvent(self, event):
+        self.annotation_model.detach_journal()
+        self._abandon_loading()
+        self.session.shutdown()
+        if self.export_thread and self.export_thread.isRunning():
+            self.export_thread.requestInterruption()
+            self.export_thread.wait()
+        self._stop_sound_only()
+        self.player.close()
+        self.curve.shutdown()
+        self.spectrogram.shutdown()
+        self.proposal_engine.shutdown()
+        super().closeEvent(event)
+
+    def toggle_hud(self):
+        if self.hud.isVisible():
+            self.hud_timer.stop()
+            self.hud.hide()
+            instrument.enable(PROFILE)
+            return
+        instrument.enable(True)
+        self.hud_last = None
+        self.update_hud()
+        self.hud_timer.start()
+
+    def update_hud(self):
+        # Rates and means cover the time since the previous refresh, peaks too
+        now = time.perf_counter()
+        stats, counters = instrument.snapshot()
+        instrument.reset_peaks()
+        last_time, last_stats = self.hud_last or (now, {})
+        self.hud_last = (now, stats)
+        elapsed = now - last_time
+
+        def window(name):
+            n, total, peak, last = stats.get(name, (0, 0, 0, 0))
+            n0, total0 = last_stats.get(name, (0, 0))[:2]
+            count = n - n0
+            return count, (total - total0) / count / 1e6 if count else 0.0, peak / 1e6, last / 1e6
+
+        frames, frame_ms, frame_peak, _ = window("scene.paint")
+        fps = frames / elapsed if elapsed > 0 else 0.0
+        jitter = window("cursor.jitter")[2]
+        wave_tiles, wave_ms, _, _ = window("waveform.tile")
+        spec_tiles, spec_ms, _, _ = window("spectrogram.tile")
+        mb = 1024 ** 2
+        samples = self.store.nbytes / mb if self.store is not None else 0.0
+        peaks = self.pyramid.nbytes / mb if self.pyramid is not None else 0.0
+        self.hud.show_text("\n".join([
+            f"FPS {fps:5.1f}   frame {frame_ms:6.2f} ms  max {frame_peak:6.2f} ms",
+            f"cursor jitter max {jitter:6.2f} ms   underruns {counters.get('playback.underruns', 0)}",
+            f"tiles  wave {wave_tiles:3d} x {wave_ms:5.1f} ms   spec {spec_tiles:3d} x {spec_ms:5.1f} ms",
+            f"decode {stats.get('decode', (0, 0, 0, 0))[3] / 1e6:8.0f} ms   cache load {stats.get('cache.load', (0, 0, 0, 0))[3] / 1e6:6.1f} ms",
+            f"samples {samples:7.1f} MB   peaks {peaks:6.1f} MB",
+            f"tile cache  wave {self.curve.cache.nbytes / mb:6.1f} MB   spec {self.spectrogram.cache.nbytes / mb:6.1f} MB",
+            f"session memory {self.session.memory.nbytes / mb:7.1f} MB",
+            "F3 hide   Ctrl+Shift+E save trace",
+        ]))
+        self.hud.show()
+
+    def export_trace(self):
+        path, _ = QtWidgets.QFileDialog.getSaveFileName(self, "Save Trace", "audio_labeler_trace.json", "Trace (*.json)")
+        if not path: return
+        try:
+            count = instrument.export_trace(path)
+        except OSError as e:
+            return self.lbl_status.setText(f"Could not save trace: {e}")
+        hint = "" if instrument.enabled else " (recording is off, press F3)"
+        self.lbl_status.setText(f"Saved {count} trace events to {path}{hint}")
+
+    def update_overview_region(self, *args):
+        self.overview_syncing = True
+        self.overview_region.setRegion(self.plot_widget.viewRange()[0])
+        self.overview_syncing = False
+
+    def on_overview_region_changed(self):
+        # Dragging the viewport moves or, by its edges, zooms the main view once per frame
+        if self.overview_syncing: return
+        self.plot_widget.scheduler.request('overview', self.follow_overview_region)
+
+    def follow_overview_region(self):
+        x_min, x_max = self.overview_region.getRegion()
+        if x_max > x_min:
+            self.plot_widget.setXRange(x_min, x_max, padding=0)
+
+    def on_overview_clicked(self, event):
+        # A click anywhere on the strip centres the current span there
+        if event.button() != QtCore.Qt.MouseButton.LeftButton or self.duration <= 0: return
+        x = self.overview_widget.getViewBox().mapSceneToView(event.scenePos()).x()
+        x_min, x_max = self.plot_widget.viewRange()[0]
+        half = (x_max - x_min) / 2
+        self.plot_widget.setXRange(x - half, x + half, padding=0)
+
+    def schedule_overview_density(self, *args):
+        self.plot_widget.scheduler.request('overview_density', self.refresh_overview_density)
+
+    def refresh_overview_density(self):
+        self.overview.set_annotations(self.annotations.starts, self.annotations.ends)
+
+    def on_spectrogram_toggled(self, checked):
+        self.spec_widget.setVisible(checked)
+        self.spectrogram.setVisible(checked)
 
     def change_tool_mode(self, index):
         modes = ['select', 'pan', 'zoom']
@@ -245,71 +548,411 @@ class AudioLabeler(QtWidgets.QMainWindow):
 
     def on_plot_clicked(self, x_pos):
         if self.duration <= 0: return
-        was_playing = self.is_playing
-        self._stop_sound_only() 
         x_pos = max(0, min(self.duration, x_pos))
+        index = int(x_pos * self.sr) - self.offset
+        if self.is_playing and 0 <= index < self.player.end:
+            # Seek inside the running stream instead of stopping and restarting it
+            self.player.seek(index)
+            self.cursor_line.setPos((self.player.position() + self.offset) / self.sr)
+            return
+        was_playing = self.is_playing
+        self._stop_sound_only()
         self.cursor_line.setPos(x_pos)
-        self.update_cursor_markers()
         if was_playing:
             self.play_selection()
 
-    def on_saved_region_clicked(self, region_item):
+    def on_saved_region_clicked(self, index):
         if self.duration <= 0: return
         self._stop_sound_only()
-        start, end = region_item.getRegion()
+        ann = self.annotations[index]
+        start, end = ann['start'], ann['end']
+        self.set_current_row(index)
         self.selection_region.setRegion([start, end])
         self.cursor_line.setPos(start)
-        self.update_cursor_markers()
         self.lbl_status.setText(f"Selected Region: {start:.2f}s - {end:.2f}s")
 
-    def update_cursor_markers(self):
-        current_x = self.cursor_line.value()
-        view_range = self.plot_widget.viewRange()
-        y_min, y_max = view_range[1]
-        self.cursor_top.setData(x=[current_x], y=[y_max])
-        self.cursor_bottom.setData(x=[current_x], y=[y_min])
-
     def load_audio_start(self):
         file_path, _ = QtWidgets.QFileDialog.getOpenFileName(self, "Open Audio", "", "Audio (*.wav *.mp3 *.flac *.ogg)")
         if not file_path: return
+        self.open_audio(file_path)
+
+    def load_audio_range_start(self):
+        file_path, _ = QtWidgets.QFileDialog.getOpenFileName(self, "Open Audio Range", "", "Audio (*.wav *.mp3 *.flac *.ogg)")
+        if not file_path: return
+        text, ok = QtWidgets.QInputDialog.getText(self, "Open Audio Range", "Time range (e.g. 1:30:00-1:35:00):")
+        if not ok or not text: return
+        try:
+            span = parse_span(text)
+        except ValueError as e:
+            QtWidgets.QMessageBox.critical(self, "Error", str(e))
+            return
+        self.open_audio(file_path, span)
+
+    def open_audio(self, file_path, span=None):
+        # With span=(start, end) in seconds the view opens there; a file that is not in memory or
+        # in the decode cache is then decoded only around it
+        self._abandon_loading()
         self.stop_audio()
+        self.annotation_model.detach_journal()
         self.clear_all_annotations()
+        self.store = None
+        self.y = None
+        self.ranged = False
+        self.range_span = span
+        self.duration = 0
+        self.curve.clear_audio()
+        self.overview.clear_audio()
+        self.spectrogram.clear_audio()
+        self.proposal_engine.clear()
+        self.plot_widget.snap_index = None
+        self.refresh_proposals()
+        self.session.set_current(file_path)
+        self.update_file_list()
+        entry = self.session.memory.get(file_path)
+        if entry is not None:
+            store, sr, pyramid, _ = entry
+            self.show_audio(file_path, store, sr, pyramid, " [memory]")
+            return
         self.lbl_status.setText(f"Loading {os.path.basename(file_path)}...")
+        self.progress_bar.setValue(0)
         self.progress_bar.setVisible(True)
-        self.setEnabled(False) 
-        self.loader_thread = AudioLoaderThread(file_path)
+        self.btn_cancel_load.setVisible(True)
+        if span is not None and file_path not in self.decode_cache:
+            self.ranged = True
+            self.audio_path = file_path
+            self.load_range(span[0] - RANGE_MARGIN, span[1] + RANGE_MARGIN)
+            return
+        if self.session.is_loading(file_path):
+            # Already being prefetched; wait for that decode instead of starting another one
+            self.pending_path = file_path
+            return
+        self.loader_thread = AudioLoaderThread(file_path, self.decode_cache)
+        self.loader_thread.started_loading.connect(self.on_audio_started)
+        self.loader_thread.chunk_loaded.connect(self.on_audio_chunk)
+        self.loader_thread.progress.connect(self.on_loading_progress)
         self.loader_thread.finished_loading.connect(self.on_audio_loaded)
+        self.loader_thread.cancelled.connect(self.on_loading_cancelled)
         self.loader_thread.error_occurred.connect(self.on_loading_error)
         self.loader_thread.start()
 
-    def on_audio_loaded(self, y, sr, duration):
-        self.y = y 
+    def cancel_loading(self):
+        if self.pending_path:
+            self.pending_path = None
+            self._finish_loading()
+            self.lbl_status.setText("Loading cancelled")
+        if self.loader_thread and self.loader_thread.isRunning():
+            self.loader_thread.requestInterruption()
+            self.loader_thread.wait()
+        if self.range_thread and self.range_thread.isRunning():
+            # One window is a bounded decode; waiting is simpler than abandoning the thread
+            self.range_thread.wait()
+        self.range_thread = None
+
+    def _abandon_loading(self):
+        # Stops the load of a file that is being replaced or closed. What the stopped thread
+        # already queued (cancelled, finished) must not reach the next file, so its sender
+        # check fails from here on
+        self.cancel_loading()
+        self.loader_thread = None
+
+    def _from_current_loader(self):
+        # A dropped thread may already be deleted, and then its queued signals have no sender
+        return self.loader_thread is not None and self.sender() is self.loader_thread
+
+    def _from_current_range(self):
+        return self.range_thread is not None and self.sender() is self.range_thread
+
+    def on_audio_started(self, store, sr, pyramid):
+        if not self._from_current_loader(): return
+        self._begin_audio(self.loader_thread.path, store, sr, pyramid, available=0)
+
+    def show_audio(self, path, store, sr, pyramid, source=""):
+        # Opens a file that is already fully decoded, e.g. from the session memory
+        self._begin_audio(path, store, sr, pyramid)
+        self.duration = len(store) / sr
+        self._finish_loading()
+        self.update_channel_choices()
+        self.lbl_status.setText(f"Loaded: {os.path.basename(path)} ({self.format_time(self.duration)}){source}")
+
+    def _begin_audio(self, path, store, sr, pyramid, available=None, offset=0, total=None):
+        # Opens on the mix; the pyramid from the loader is always built over it
+        self.offset = offset
+        self.total_frames = len(store) if total is None else total
+        self.plot_widget.scheduler.set_extent(self.total_frames / sr)
+        self.store = store
+        self.channel = None
+        self.lane_pyramids = {None: pyramid}
+        self.update_channel_choices(loading=True)
+        y = self.y = store.view()
         self.sr = sr
-        self.duration = duration
-        self.audio_path = self.loader_thread.path
-        
-        t = np.linspace(0, self.duration, len(y))
-        self.curve.setData(t, y)
+        self.duration = 0
+        self.pyramid = pyramid
+        self.audio_path = path
+        self.curve.set_audio(y, sr, pyramid, offset)
+        self.overview.set_audio(pyramid, sr, self.total_frames, offset)
+        self.overview_widget.setXRange(0, self.total_frames / sr, padding=0)
+        self.overview_region.setBounds([0, self.total_frames / sr])
+        self.player.set_audio(y, sr)
+        self.spectrogram.set_audio(y, sr, available=available, offset=offset)
+        if not self.ranged:
+            self.spectrogram.set_precomputed(self.decode_cache.load_spectrogram(path))
+        self.proposal_engine.set_audio(y, sr, available=available, offset=offset)
 
-        self.plot_widget.setXRange(0, self.duration)
+        self.plot_widget.setXRange(*(self.range_span or (offset / sr, (offset + len(y)) / sr)))
         self.plot_widget.setYRange(-1.1, 1.1)
+        self.spec_widget.setYRange(0, sr / 2, padding=0)
         
-        self.selection_region.setRegion([0, 0])
-        self.cursor_line.setPos(0)
-        self.update_cursor_markers()
-        self.progress_bar.setVisible(False)
-        self.setEnabled(True)
-        self.lbl_status.setText(f"Loaded: {os.path.basename(self.audio_path)} ({self.format_time(self.duration)})")
+        start = self.range_span[0] if self.range_span else 0
+        self.selection_region.setRegion([start, start])
+        self.cursor_line.setPos(start)
+        self.open_journal()
+
+    def open_journal(self):
+        journal = AnnotationJournal(self.audio_path, self.total_frames / self.sr)
+        try:
+            self.annotation_model.attach_journal(journal)
+        except (OSError, ValueError, KeyError) as e:
+            self.lbl_status.setText(f"Autosave unavailable: {e}")
+            return
+        if len(self.annotations):
+            self.lbl_status.setText(f"Restored {len(self.annotations)} annotations from autosave")
+
+    def compact_journal(self):
+        journal = self.annotation_model.journal
+        if journal is None: return
+        if journal.error:
+            self.lbl_status.setText(f"Autosave failed: {journal.error}")
+            self.annotation_model.detach_journal()
+        elif journal.dirty:
+            journal.compact(self.annotations)
+
+    def on_audio_chunk(self, filled):
+        if not self._from_current_loader(): return
+        self.duration = filled / self.sr
+        self.curve.update_view()
+        self.overview.refresh_envelope()
+        self.spectrogram.set_available(filled)
+        self.proposal_engine.set_available(filled)
+
+    def on_loading_progress(self, percent):
+        if not self._from_current_loader(): return
+        self.progress_bar.setValue(percent)
+        self.lbl_status.setText(f"Loading {os.path.basename(self.loader_thread.path)}... {self.format_time(self.duration)} decoded")
+
+    def on_audio_loaded(self, store, sr, duration, pyramid):
+        if not self._from_current_loader(): return
+        self.store = store
+        self.lane_pyramids = {None: pyramid}
+        y = self.y = store.view()
+        self.sr = sr
+        self.duration = duration
+        self.pyramid = pyramid
+        self.curve.set_audio(y, sr, pyramid)
+        self.overview.refresh_envelope()
+        self.player.set_audio(y, sr)
+        self.spectrogram.set_audio(y, sr)
+        self.proposal_engine.set_audio(y, sr)
+        self._finish_loading()
+        self.update_channel_choices()
+        self.session.remember(self.audio_path, store, sr, pyramid)
+        source = " [cache]" if self.loader_thread.from_cache else ""
+        self.lbl_status.setText(f"Loaded: {os.path.basename(self.audio_path)} ({self.format_time(self.duration)}){source}")
+
+    def on_loading_cancelled(self, filled):
+        if not self._from_current_loader(): return
+        self._finish_loading()
+        if self.store is None: return
+        self.store = self.store.truncate(filled)
+        self.total_frames = filled
+        self.plot_widget.scheduler.set_extent(filled / self.sr)
+        self.lane_pyramids = {None: self.pyramid}
+        self.y = self.store.view()
+        self.duration = filled / self.sr
+        self.curve.set_audio(self.y, self.sr, self.pyramid)
+        self.overview.set_audio(self.pyramid, self.sr, filled)
+        self.overview_widget.setXRange(0, self.duration, padding=0)
+        self.schedule_overview_density()
+        self.player.set_audio(self.y, self.sr)
+        self.spectrogram.set_audio(self.y, self.sr)
+        self.proposal_engine.set_audio(self.y, self.sr)
+        self.update_channel_choices()
+        self.lbl_status.setText(f"Loading cancelled: kept first {self.format_time(self.duration)}")
 
     def on_loading_error(self, err_msg):
-        self.progress_bar.setVisible(False)
-        self.setEnabled(True)
+        if not self._from_current_loader(): return
+        self._finish_loading()
+        QtWidgets.QMessageBox.critical(self, "Error", err_msg)
+
+    def update_channel_choices(self, loading=False):
+        # Mix plus one entry per channel; lanes can only be switched once the whole file is decoded
+        channels = self.store.channels if self.store is not None else 1
+        self.combo_channel.blockSignals(True)
+        self.combo_channel.clear()
+        self.combo_channel.addItems(["Mix"] + ([str(c + 1) for c in range(channels)] if channels > 1 else []))
+        self.combo_channel.setCurrentIndex(0 if self.channel is None else self.channel + 1)
+        self.combo_channel.blockSignals(False)
+        self.combo_channel.setEnabled(channels > 1 and not loading)
+
+    def on_channel_changed(self, index):
+        # Shows, plays and analyses one channel of the store, or the mix of all of them
+        channel = None if index <= 0 else index - 1
+        if self.store is None or channel == self.channel: return
+        self._stop_sound_only()
+        self.channel = channel
+        self.y = self.store.view(channel)
+        self.pyramid = self._lane_pyramid(channel)
+        self._show_lane()
+        if channel is None and not self.ranged:
+            # Spectrogram levels in the decode cache are of the mix
+            self.spectrogram.set_precomputed(self.decode_cache.load_spectrogram(self.audio_path))
+        self.lbl_status.setText("Showing mix of all channels" if channel is None else f"Showing channel {channel + 1}")
+
+    def _lane_pyramid(self, channel):
+        if channel not in self.lane_pyramids:
+            QtWidgets.QApplication.setOverrideCursor(QtCore.Qt.CursorShape.WaitCursor)
+            try:
+                self.lane_pyramids[channel] = PeakPyramid(self.store.view(channel))
+            finally:
+                QtWidgets.QApplication.restoreOverrideCursor()
+        return self.lane_pyramids[channel]
+
+    def _show_lane(self):
+        # Hands the lane on screen, and the file position of its first sample, to everything that reads it
+        self.curve.set_audio(self.y, self.sr, self.pyramid, self.offset)
+        self.overview.set_audio(self.pyramid, self.sr, self.total_frames, self.offset)
+        self.player.set_audio(self.y, self.sr)
+        self.spectrogram.set_audio(self.y, self.sr, offset=self.offset)
+        self.proposal_engine.set_audio(self.y, self.sr, offset=self.offset)
+
+    def load_range(self, start, stop, base=None):
+        # base is the window in memory; the loader joins the new part to it when they touch
+        self.range_thread = RangeLoaderThread(self.audio_path, max(0.0, start), stop, base, self.offset, self.channel)
+        self.range_thread.finished_loading.connect(self.on_range_loaded)
+        self.range_thread.error_occurred.connect(self.on_range_error)
+        self.range_thread.start()
+
+    def on_range_loaded(self, store, sr, first, total, pyramid):
+        if not self._from_current_range(): return
+        if self.store is None:
+            self._begin_audio(self.audio_path, store, sr, pyramid, offset=first, total=total)
+            self.duration = total / sr
+            self._finish_loading()
+            self.update_channel_choices()
+        else:
+            self._stop_sound_only()
+            self.store = store
+            self.offset = first
+            self.lane_pyramids = {self.range_thread.channel: pyramid}
+            self.y = store.view(self.channel)
+            self.pyramid = self._lane_pyramid(self.channel)
+            self._show_lane()
+        self.lbl_status.setText(f"Loaded: {os.path.basename(self.audio_path)} "
+                                f"{self.format_time(first / sr)} - {self.format_time((first + len(store)) / sr)} "
+                                f"of {self.format_time(self.duration)}")
+        # The view may have moved on while this part was decoding
+        self.plot_widget.scheduler.request('range', self.extend_range)
+
+    def on_range_error(self, err_msg):
+        if not self._from_current_range(): return
+        self._finish_loading()
         QtWidgets.QMessageBox.critical(self, "Error", err_msg)
 
+    def extend_range(self):
+        # Decodes whatever part of the view lies outside the window in memory. The window grows
+        # by the missing side until RANGE_MAX_SECONDS; a view further away gets a window of its own
+        if not self.ranged or self.store is None: return
+        if self.range_thread is not None and self.range_thread.isRunning(): return
+        total = self.total_frames / self.sr
+        first, last = self.offset / self.sr, (self.offset + len(self.store)) / self.sr
+        x_min, x_max = self.plot_widget.viewRange()[0]
+        x_min, x_max = max(0.0, x_min), min(total, x_max)
+        if x_min >= first and x_max <= last: return
+        start, stop = max(0.0, x_min - RANGE_MARGIN), min(total, x_max + RANGE_MARGIN)
+        base = self.store
+        if max(stop, last) - min(start, first) <= RANGE_MAX_SECONDS:
+            if start >= first:
+                start = last
+            elif stop <= last:
+                stop = first
+        else:
+            centre, half = (x_min + x_max) / 2, min(stop - start, RANGE_MAX_SECONDS) / 2
+            start, stop = max(0.0, centre - half), min(total, centre + half)
+            base = None
+        self.lbl_status.setText(f"Decoding {self.format_time(start)} - {self.format_time(stop)}...")
+        self.load_range(start, stop, base)
+
+    def open_session_folder(self):
+        folder = QtWidgets.QFileDialog.getExistingDirectory(self, "Open Folder")
+        if folder: self.open_session(folder)
+
+    def open_session_manifest(self):
+        path, _ = QtWidgets.QFileDialog.getOpenFileName(self, "Open Manifest", "", "Manifest (*.txt *.csv *.m3u)")
+        if path: self.open_session(path)
+
+    def open_session(self, path):
+        try:
+            files = self.session.open(path)
+        except (OSError, UnicodeDecodeError) as e:
+            return self.lbl_status.setText(f"Could not open session: {e}")
+        self.file_list.clear()
+        for file_path in files:
+            item = QtWidgets.QListWidgetItem(os.path.basename(file_path))
+            item.setToolTip(file_path)
+            self.file_list.addItem(item)
+        self.file_dock.setVisible(bool(files))
+        self.btn_next_file.setEnabled(bool(files))
+        if not files:
+            return self.lbl_status.setText("No audio files found")
+        self.open_audio(files[0])
+
+    def next_file(self):
+        path = self.session.next_path(1)
+        if path: self.open_audio(path)
+
+    def previous_file(self):
+        path = self.session.next_path(-1)
+        if path: self.open_audio(path)
+
+    def on_file_activated(self, item):
+        self.open_audio(self.session.files[self.file_list.row(item)])
+
+    def update_file_list(self):
+        ready = self.style().standardIcon(QtWidgets.QStyle.StandardPixmap.SP_DialogApplyButton)
+        for row, path in enumerate(self.session.files):
+            item = self.file_list.item(row)
+            item.setIcon(ready if path in self.session.memory else QtGui.QIcon())
+            font = item.font()
+            font.setBold(row == self.session.index)
+            item.setFont(font)
+        if self.session.index >= 0:
+            self.file_list.setCurrentRow(self.session.index)
+        self.btn_next_file.setEnabled(self.session.next_path(1) is not None)
+
+    def on_file_prefetched(self, path):
+        self.update_file_list()
+        if path != self.pending_path: return
+        self.pending_path = None
+        store, sr, pyramid, _ = self.session.memory.get(path)
+        self.show_audio(path, store, sr, pyramid)
+
+    def on_file_prefetch_failed(self, path, err_msg):
+        if path != self.pending_path: return
+        self.pending_path = None
+        self._finish_loading()
+        QtWidgets.QMessageBox.critical(self, "Error", err_msg)
+
+    def on_file_prefetch_progress(self, path, percent):
+        if path == self.pending_path:
+            self.progress_bar.setValue(percent)
+
+    def _finish_loading(self):
+        self.progress_bar.setVisible(False)
+        self.btn_cancel_load.setVisible(False)
+
     def _stop_sound_only(self):
         self.is_playing = False
         self.play_timer.stop()
-        sd.stop()
+        self.player.stop()
 
     def toggle_play_pause(self):
         if self.is_playing: self.pause_audio()
@@ -323,19 +966,24 @@ class AudioLabeler(QtWidgets.QMainWindow):
     def stop_audio(self):
         self._stop_sound_only()
         self.cursor_line.setPos(0)
-        self.update_cursor_markers()
         self.selection_region.setRegion([0, 0])
         self.lbl_status.setText("Stopped (Reset)")
 
     def on_speed_changed(self):
-        if self.is_playing:
-            self.play_selection()
+        self.player.set_speed(self.spin_speed.value())
+
+    def on_loop_toggled(self, checked):
+        self.player.set_loop(checked and self._has_selection())
+
+    def _has_selection(self):
+        sel_min, sel_max = self.selection_region.getRegion()
+        return (sel_max - sel_min) > 0.05
 
     def play_selection(self):
         if self.y is None: return
         self._stop_sound_only()
         sel_min, sel_max = self.selection_region.getRegion()
-        has_selection = (sel_max - sel_min) > 0.05
+        has_selection = self._has_selection()
         if has_selection:
             start_point = sel_min
             end_point = sel_max
@@ -344,38 +992,40 @@ class AudioLabeler(QtWidgets.QMainWindow):
             end_point = self.duration
         start_point = max(0, min(self.duration, start_point))
         if end_point <= start_point: end_point = self.duration
-        s_idx = int(start_point * self.sr)
-        e_idx = int(end_point * self.sr)
+        # Sample indices into the window in memory, which starts at offset
+        s_idx = max(0, int(start_point * self.sr) - self.offset)
+        e_idx = min(len(self.y), int(min(end_point, self.duration) * self.sr) - self.offset)
         if e_idx <= s_idx: return
         
         speed = self.spin_speed.value()
-        new_sr = int(self.sr * speed)
-        
-        sd.play(self.y[s_idx:e_idx], new_sr)
+        self.player.set_speed(speed)
+        self.player.play(s_idx, e_idx, loop=has_selection and self.chk_loop.isChecked())
         self.is_playing = True
-        self.play_start_time = time.time()
-        self.play_offset = start_point
-        self.cursor_line.setPos(start_point)
-        self.update_cursor_markers()
+        self.last_tick = None
+        self.cursor_line.setPos(max(start_point, self.offset / self.sr))
         self.play_timer.start()
         self.lbl_status.setText(f"Playing at {speed}x...")
 
     def update_cursor_animation(self):
         if not self.is_playing: return
-        elapsed = time.time() - self.play_start_time
-        
-        speed = self.spin_speed.value()
-        current_pos = self.play_offset + (elapsed * speed)
-        
+        if instrument.enabled:
+            self.measure_tick()
+        current_pos = (self.player.position() + self.offset) / self.sr
         self.cursor_line.setPos(current_pos)
-        self.update_cursor_markers()
-        sel_min, sel_max = self.selection_region.getRegion()
-        has_selection = (sel_max - sel_min) > 0.05
-        if has_selection and current_pos >= sel_max and self.play_offset < sel_max:
-            self.pause_audio()
-        elif current_pos >= self.duration:
+        if not self.player.playing:
             self._stop_sound_only()
 
+    def measure_tick(self):
+        # Lateness of this tick against the timer interval, and underruns since the last tick
+        now = time.perf_counter_ns()
+        if self.last_tick is not None:
+            instrument.sample("cursor.jitter", abs(now - self.last_tick - self.play_timer.interval() * 1_000_000))
+        self.last_tick = now
+        underruns = self.player.underruns
+        if underruns != self.reported_underruns:
+            instrument.count("playback.underruns", underruns - self.reported_underruns)
+            self.reported_underruns = underruns
+
     def add_annotation_from_selection(self):
         if self.y is None: return
         self.pause_audio()
@@ -386,85 +1036,182 @@ class AudioLabeler(QtWidgets.QMainWindow):
             return
         label, ok = QtWidgets.QInputDialog.getText(self, "New Label", "Class Name:")
         if ok and label:
-            self.annotations.append({"start": start, "end": end, "label": label})
-            self.add_visual_region(start, end, label)
-            self.update_listbox()
+            self.last_label = label
+            overlaps = len(self.annotations.overlapping(start, end))
+            row = self.annotation_model.add(start, end, label)
+            self.set_current_row(row)
+            if self.annotation_model.journal and self.annotation_model.journal.needs_compaction():
+                self.compact_journal()
+            if overlaps:
+                self.lbl_status.setText(f"Label '{label}' overlaps {overlaps} existing annotation(s)")
             self.selection_region.setRegion([end, end])
             self.cursor_line.setPos(end)
-            self.update_cursor_markers()
-
-    def add_visual_region(self, start, end, label):
-        region = pg.LinearRegionItem(values=(start, end), brush=pg.mkBrush(THEME['saved_region']), movable=False)
-        text = pg.TextItem(text=label, color=THEME['fg'], anchor=(0.5, 1))
-        text.setPos((start + end) / 2, 1.0)
-        region.is_saved = True
-        region.setZValue(5)
-        text.setZValue(5)
-        self.plot_widget.addItem(region)
-        self.plot_widget.addItem(text)
-        self.region_items.append((region, text))
-
-    def update_listbox(self):
-        self.list_widget.clear()
-        for i, ann in enumerate(self.annotations):
-            self.list_widget.addItem(f"{i+1:02d} | {ann['label']} | {self.format_time(ann['start'])} - {self.format_time(ann['end'])}")
+    
+    def schedule_proposals(self, *args):
+        if self.chk_proposals.isChecked():
+            self.proposal_timer.start()
+
+    def on_proposals_updated(self, generation):
+        if generation == self.proposal_engine.generation:
+            self.plot_widget.snap_index = self.proposal_engine.snap_index
+            self.schedule_proposals()
+
+    def on_snap_toggled(self, checked):
+        self.plot_widget.snap_enabled = checked
+
+    def on_proposals_toggled(self, checked):
+        self.proposal_item.setVisible(checked)
+        self.refresh_proposals()
+
+    def refresh_proposals(self):
+        self.proposals.clear()
+        features = self.proposal_engine.features
+        if features is not None and self.chk_proposals.isChecked():
+            starts, ends = detect(features, self.spin_threshold.value(), self.spin_min_duration.value())
+            # Features start at the first sample in memory, which is not time 0 in a range
+            start = self.proposal_engine.offset / features.sr
+            starts, ends = starts + start, ends + start
+            # Events that are already labelled are not proposed again
+            keep = [i for i, (s, e) in enumerate(zip(starts, ends)) if not len(self.annotations.overlapping(s, e))]
+            self.proposals.extend_ids(starts[keep], ends[keep], np.zeros(len(keep), dtype=np.int32), [""])
+        self.proposal_item.refresh()
+
+    def accept_proposal(self):
+        # Labels the proposal under the cursor, or else the next one, with the last label used
+        if not self.chk_proposals.isChecked() or not len(self.proposals): return
+        x = self.cursor_line.value()
+        row = self.proposals.index_at(x)
+        if row is None:
+            row = self.proposals.next_after(x)
+        if row is None:
+            return self.lbl_status.setText("No more proposals after the cursor")
+        if not self.last_label:
+            label, ok = QtWidgets.QInputDialog.getText(self, "New Label", "Class Name:")
+            if not ok or not label: return
+            self.last_label = label
+        ann = self.proposals[row]
+        row = self.annotation_model.add(ann['start'], ann['end'], self.last_label)
+        self.set_current_row(row)
+        self.refresh_proposals()
+        if self.annotation_model.journal and self.annotation_model.journal.needs_compaction():
+            self.compact_journal()
+        self.selection_region.setRegion([ann['end'], ann['end']])
+        self.cursor_line.setPos(ann['end'])
+        self.lbl_status.setText(f"Accepted {ann['start']:.2f}s - {ann['end']:.2f}s as '{self.last_label}'")
+
+    def select_next_annotation(self):
+        row = self.annotations.next_after(self.cursor_line.value())
+        if row is not None: self.select_annotation(row)
+
+    def select_previous_annotation(self):
+        row = self.annotations.previous_before(self.cursor_line.value())
+        if row is not None: self.select_annotation(row)
+
+    def select_annotation(self, row):
+        self._stop_sound_only()
+        ann = self.annotations[row]
+        x_min, x_max = self.plot_widget.viewRange()[0]
+        if ann['start'] < x_min or ann['end'] > x_max:
+            width = max(x_max - x_min, ann['end'] - ann['start'])
+            center = (ann['start'] + ann['end']) / 2
+            self.plot_widget.setXRange(center - width / 2, center + width / 2, padding=0)
+        self.selection_region.setRegion([ann['start'], ann['end']])
+        self.cursor_line.setPos(ann['start'])
+        self.set_current_row(row)
+        self.lbl_status.setText(f"{ann['label']}: {ann['start']:.2f}s - {ann['end']:.2f}s")
+
+    def current_row(self):
+        index = self.annotation_view.currentIndex()
+        if not index.isValid(): return -1
+        return self.annotation_proxy.mapToSource(index).row()
+
+    def set_current_row(self, row):
+        index = self.annotation_proxy.mapFromSource(self.annotation_model.index(row, 0))
+        if index.isValid():
+            self.annotation_view.setCurrentIndex(index)
+            self.annotation_view.scrollTo(index)
+
+    def on_filter_changed(self, text):
+        self.annotation_proxy.set_label_filter(text)
+
+    def schedule_list_time_window(self, *args):
+        if self.chk_in_view.isChecked():
+            self.list_window_timer.start()
+
+    def update_list_time_window(self, *args):
+        if self.chk_in_view.isChecked():
+            self.annotation_proxy.set_time_window(tuple(self.plot_widget.viewRange()[0]))
+        elif self.annotation_proxy.time_window is not None:
+            self.annotation_proxy.set_time_window(None)
 
     def format_time(self, seconds):
-        m, s = divmod(seconds, 60)
-        ms = int((seconds % 1) * 100)
-        return f"{int(m):02d}:{int(s):02d}.{ms:02d}"
+        return format_time(seconds)
 
     def show_context_menu(self, pos):
-        item = self.list_widget.itemAt(pos)
-        if not item: return
+        index = self.annotation_view.indexAt(pos)
+        if not index.isValid(): return
         menu = QtWidgets.QMenu(self)
+        menu.addAction("✏ Rename", lambda: self.annotation_view.edit(index.siblingAtColumn(AnnotationTableModel.COL_LABEL)))
         menu.addAction("❌ Delete", self.delete_selected_annotation)
-        menu.exec(self.list_widget.mapToGlobal(pos))
+        menu.exec(self.annotation_view.viewport().mapToGlobal(pos))
 
     def delete_selected_annotation(self):
-        row = self.list_widget.currentRow()
+        row = self.current_row()
         if row >= 0:
-            r, t = self.region_items.pop(row)
-            self.plot_widget.removeItem(r)
-            self.plot_widget.removeItem(t)
-            self.annotations.pop(row)
-            self.update_listbox()
+            self.annotation_model.remove(row)
 
     def clear_all_annotations(self):
-        for r, t in self.region_items:
-            self.plot_widget.removeItem(r)
-            self.plot_widget.removeItem(t)
-        self.region_items = []
-        self.annotations = []
-        self.list_widget.clear()
+        self.annotation_model.clear()
 
     def save_annotations(self):
         if not self.audio_path: return
         default_name = os.path.splitext(self.audio_path)[0] + ".json"
-        path, _ = QtWidgets.QFileDialog.getSaveFileName(self, "Save", default_name, "JSON (*.json)")
+        path, _ = QtWidgets.QFileDialog.getSaveFileName(self, "Save", default_name, "JSON (*.json);;Compact binary (*.npz)")
         if path:
-            with open(path, 'w', encoding='utf-8') as f:
-                json.dump({"file": os.path.basename(self.audio_path), "duration": self.duration, "annotations": self.annotations}, f, indent=4)
+            header = {"file": os.path.basename(self.audio_path), "duration": self.duration}
+            with instrument.span("annotations.save"):
+                write_annotation_file(path, self.annotations, header)
             self.lbl_status.setText(f"Saved to {path}")
 
     def load_annotations_from_file(self):
         if not self.audio_path: return self.lbl_status.setText("Load audio first!")
-        path, _ = QtWidgets.QFileDialog.getOpenFileName(self, "Load JSON", "", "JSON (*.json)")
+        path, _ = QtWidgets.QFileDialog.getOpenFileName(self, "Load JSON", "", "Annotations (*.json *.npz)")
         if path:
-            with open(path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            self.clear_all_annotations()
-            for ann in data.get("annotations", []):
-                self.annotations.append(ann)
-                self.add_visual_region(ann['start'], ann['end'], ann['label'])
-            self.update_listbox()
-
-    def on_list_double_click(self, item):
-        idx = self.list_widget.row(item)
+            try:
+                self.annotation_model.load(path)
+            except (OSError, ValueError, KeyError) as e:
+                self.lbl_status.setText(f"Could not load annotations: {e}")
+
+    def export_clips(self):
+        if not self.audio_path or not len(self.annotations):
+            return self.lbl_status.setText("Nothing to export")
+        if self.progress_bar.isVisible():
+            return self.lbl_status.setText("Wait for the current job to finish")
+        out_dir = QtWidgets.QFileDialog.getExistingDirectory(self, "Export Clips To")
+        if not out_dir: return
+        sources = {self.audio_path: store_segments(self.annotations)}
+        self.export_thread = ExportThread(sources, out_dir, self.decode_cache.root)
+        self.export_thread.progress.connect(self.progress_bar.setValue)
+        self.export_thread.finished_export.connect(self.on_export_finished)
+        self.export_thread.error_occurred.connect(self.on_export_error)
+        self.progress_bar.setValue(0)
+        self.progress_bar.setVisible(True)
+        self.lbl_status.setText(f"Exporting {len(self.annotations)} clips...")
+        self.export_thread.start()
+
+    def on_export_finished(self, count, out_dir):
+        self.progress_bar.setVisible(False)
+        self.lbl_status.setText(f"Exported {count} clips to {out_dir}")
+
+    def on_export_error(self, err_msg):
+        self.progress_bar.setVisible(False)
+        QtWidgets.QMessageBox.critical(self, "Export failed", err_msg)
+
+    def on_list_double_click(self, index):
+        idx = self.annotation_proxy.mapToSource(index).row()
         ann = self.annotations[idx]
         margin = (ann['end'] - ann['start']) * 0.5
         self.plot_widget.setXRange(max(0, ann['start'] - margin), min(self.duration, ann['end'] + margin))
         self.cursor_line.setPos(ann['start'])
-        self.update_cursor_markers()
         self.selection_region.setRegion([ann['start'], ann['end']])
         self.play_selection()
\ No newline at end of file
@@ -0,0 +1,317 @@
+import numpy as np
+from PyQt6.QtCore import Qt, QAbstractProxyModel, QAbstractTableModel, QModelIndex
+import instrument
+from annotations import read_annotation_file
+
+
+def format_time(seconds):
+    m, s = divmod(seconds, 60)
+    ms = int((seconds % 1) * 100)
+    return f"{int(m):02d}:{int(s):02d}.{ms:02d}"
+
+
+def parse_time(text):
+    # Seconds, mm:ss or hh:mm:ss, each with an optional fraction
+    parts = text.strip().split(":")
+    if len(parts) > 3:
+        raise ValueError(f"not a time: {text!r}")
+    seconds = 0.0
+    for part in parts:
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+
+def parse_span(text):
+    # "start-end" in any form parse_time reads
+    start, sep, end = text.partition("-")
+    if not sep:
+        raise ValueError(f"expected start-end, got {text!r}")
+    start, end = parse_time(start), parse_time(end)
+    if end <= start:
+        raise ValueError(f"{text!r}: the end must come after the start")
+    return start, end
+
+
+class AnnotationTableModel(QAbstractTableModel):
+    COLUMNS = ["Label", "Start", "End"]
+    COL_LABEL, COL_START, COL_END = range(3)
+
+    def __init__(self, store, parent=None):
+        super().__init__(parent)
+        self.store = store
+        self.journal = None
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.store)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.COLUMNS)
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role != Qt.ItemDataRole.DisplayRole: return None
+        if orientation == Qt.Orientation.Horizontal:
+            return self.COLUMNS[section]
+        return f"{section + 1:02d}"
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid(): return None
+        row, col = index.row(), index.column()
+        if role == Qt.ItemDataRole.UserRole:
+            # Raw values for sorting
+            if col == self.COL_LABEL: return self.store.labels[self.store.label_ids[row]]
+            if col == self.COL_START: return float(self.store.starts[row])
+            return float(self.store.ends[row])
+        if role in (Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.EditRole):
+            if col == self.COL_LABEL: return self.store.labels[self.store.label_ids[row]]
+            if col == self.COL_START: return format_time(self.store.starts[row])
+            return format_time(self.store.ends[row])
+        return None
+
+    def flags(self, index):
+        flags = super().flags(index)
+        if index.column() == self.COL_LABEL:
+            flags |= Qt.ItemFlag.ItemIsEditable
+        return flags
+
+    def setData(self, index, value, role=Qt.ItemDataRole.EditRole):
+        if role != Qt.ItemDataRole.EditRole or index.column() != self.COL_LABEL or not value:
+            return False
+        self.set_label(index.row(), value)
+        return True
+
+    @instrument.timed("annotations.add")
+    def add(self, start, end, label):
+        row = self.store.insert_position(start)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.store.add(start, end, label)
+        self.endInsertRows()
+        if self.journal:
+            self.journal.record_add(start, end, label)
+        return row
+
+    @instrument.timed("annotations.remove")
+    def remove(self, row):
+        ann = self.store[row]
+        self.beginRemoveRows(QModelIndex(), row, row)
+        self.store.remove(row)
+        self.endRemoveRows()
+        if self.journal:
+            self.journal.record_remove(ann['start'], ann['end'], ann['label'])
+
+    @instrument.timed("annotations.relabel")
+    def set_label(self, row, label):
+        ann = self.store[row]
+        self.store.set_label(row, label)
+        index = self.index(row, self.COL_LABEL)
+        self.dataChanged.emit(index, index)
+        if self.journal:
+            self.journal.record_relabel(ann['start'], ann['end'], ann['label'], label)
+
+    @instrument.timed("annotations.extend")
+    def extend(self, starts, ends, labels):
+        self.beginResetModel()
+        self.store.extend(starts, ends, labels)
+        self.endResetModel()
+        if self.journal:
+            self.journal.compact(self.store)
+
+    @instrument.timed("annotations.load")
+    def load(self, path):
+        # Replaces the store contents with an annotation file; returns the file's header fields
+        self.beginResetModel()
+        self.store.clear()
+        try:
+            meta = read_annotation_file(path, self.store)
+        finally:
+            self.endResetModel()
+        if self.journal:
+            self.journal.compact(self.store)
+        return meta
+
+    @instrument.timed("annotations.clear")
+    def clear(self):
+        self.beginResetModel()
+        self.store.clear()
+        self.endResetModel()
+        if self.journal:
+            self.journal.compact(self.store)
+
+    def attach_journal(self, journal):
+        # Replays the journal into the store, then records further edits to it
+        self.beginResetModel()
+        self.store.clear()
+        try:
+            journal.recover(self.store)
+        finally:
+            self.endResetModel()
+        self.journal = journal
+        journal.start()
+
+    def detach_journal(self):
+        if self.journal:
+            self.journal.close(self.store)
+        self.journal = None
+
+
+class AnnotationFilterProxy(QAbstractProxyModel):
+    # Label filter, time window and column sort over the annotation model. The rows shown are
+    # one numpy array of source rows, computed from the store without visiting rows in Python;
+    # with no filter and no sort the mapping is the identity and source edits pass straight through
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.label_filter = ""
+        self.time_window = None
+        self.sort_column = -1
+        self.sort_order = Qt.SortOrder.AscendingOrder
+        self.rows = None
+        self.inverse = None
+        self.pending = []
+
+    def setSourceModel(self, model):
+        super().setSourceModel(model)
+        model.rowsAboutToBeInserted.connect(self._before_rows_inserted)
+        model.rowsInserted.connect(self._rows_inserted)
+        model.rowsAboutToBeRemoved.connect(self._before_rows_removed)
+        model.rowsRemoved.connect(self._rows_removed)
+        model.modelAboutToBeReset.connect(self.beginResetModel)
+        model.modelReset.connect(self._model_reset)
+        model.dataChanged.connect(self._data_changed)
+        self.rows = self._ordered(self._accepted())
+
+    def set_label_filter(self, text):
+        text = text.strip().lower()
+        if text == self.label_filter: return
+        self.label_filter = text
+        self._refresh()
+
+    def set_time_window(self, window):
+        if window == self.time_window: return
+        self.time_window = window
+        self._refresh()
+
+    def sort(self, column, order=Qt.SortOrder.AscendingOrder):
+        self.sort_column = column
+        self.sort_order = order
+        self._refresh()
+
+    def _accepted(self):
+        # Source rows passing both filters in source order, or None when nothing is filtered
+        store = self.sourceModel().store
+        rows = None
+        if self.time_window is not None:
+            rows = store.visible(*self.time_window)
+        if self.label_filter:
+            matching = np.array([self.label_filter in label.lower() for label in store.labels] + [False])
+            keep = matching[store.label_ids if rows is None else store.label_ids[rows]]
+            rows = np.nonzero(keep)[0] if rows is None else rows[keep]
+        return rows
+
+    def _ordered(self, rows):
+        if self.sort_column < 0:
+            return rows
+        store = self.sourceModel().store
+        if rows is None:
+            rows = np.arange(len(store))
+        if self.sort_column == AnnotationTableModel.COL_LABEL:
+            rank = np.empty(len(store.labels), dtype=np.int64)
+            rank[sorted(range(len(store.labels)), key=store.labels.__getitem__)] = np.arange(len(store.labels))
+            keys = rank[store.label_ids[rows]]
+        elif self.sort_column == AnnotationTableModel.COL_START:
+            keys = store.starts[rows]
+        else:
+            keys = store.ends[rows]
+        # Negated keys keep ties in source order when descending, as a stable sort should
+        if self.sort_order == Qt.SortOrder.DescendingOrder:
+            keys = -keys
+        return rows[np.argsort(keys, kind='stable')]
+
+    def source_row(self, row):
+        return row if self.rows is None else int(self.rows[row])
+
+    def proxy_row(self, source_row):
+        if self.rows is None:
+            return source_row
+        if self.inverse is None:
+            self.inverse = np.full(self.sourceModel().rowCount(), -1, dtype=np.int64)
+            self.inverse[self.rows] = np.arange(len(self.rows))
+        return int(self.inverse[source_row])
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid() or self.sourceModel() is None: return 0
+        return self.sourceModel().rowCount() if self.rows is None else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        if parent.isValid() or self.sourceModel() is None: return 0
+        return self.sourceModel().columnCount()
+
+    def index(self, row, column, parent=QModelIndex()):
+        if parent.isValid() or not (0 <= row < self.rowCount() and 0 <= column < self.columnCount()):
+            return QModelIndex()
+        return self.createIndex(row, column)
+
+    def parent(self, index=QModelIndex()):
+        return QModelIndex()
+
+    def mapToSource(self, index):
+        if not index.isValid() or self.sourceModel() is None: return QModelIndex()
+        return self.sourceModel().index(self.source_row(index.row()), index.column())
+
+    def mapFromSource(self, index):
+        if not index.isValid(): return QModelIndex()
+        row = self.proxy_row(index.row())
+        return self.createIndex(row, index.column()) if row >= 0 else QModelIndex()
+
+    def _refresh(self):
+        self._begin_remap()
+        self._remap(self.pending)
+
+    def _begin_remap(self):
+        # Outside the identity mapping any source edit redoes the mapping as a layout change,
+        # which keeps the selection on the same annotations
+        self.layoutAboutToBeChanged.emit()
+        self.pending = [(index, self.source_row(index.row())) for index in self.persistentIndexList()]
+
+    def _remap(self, persistent):
+        self.rows = self._ordered(self._accepted())
+        self.inverse = None
+        for index, source_row in persistent:
+            row = self.proxy_row(source_row) if source_row >= 0 else -1
+            self.changePersistentIndex(index, self.createIndex(row, index.column()) if row >= 0 else QModelIndex())
+        self.pending = []
+        self.layoutChanged.emit()
+
+    def _before_rows_inserted(self, parent, first, last):
+        if self.rows is None:
+            return self.beginInsertRows(QModelIndex(), first, last)
+        self._begin_remap()
+
+    def _rows_inserted(self, parent, first, last):
+        if self.rows is None:
+            return self.endInsertRows()
+        count = last - first + 1
+        self._remap([(index, row + count if row >= first else row) for index, row in self.pending])
+
+    def _before_rows_removed(self, parent, first, last):
+        if self.rows is None:
+            return self.beginRemoveRows(QModelIndex(), first, last)
+        self._begin_remap()
+
+    def _rows_removed(self, parent, first, last):
+        if self.rows is None:
+            return self.endRemoveRows()
+        count = last - first + 1
+        self._remap([(index, row if row < first else -1 if row <= last else row - count)
+                     for index, row in self.pending])
+
+    def _model_reset(self):
+        self.rows = self._ordered(self._accepted())
+        self.inverse = None
+        self.endResetModel()
+
+    def _data_changed(self, top_left, bottom_right, roles=()):
+        if self.label_filter or self.sort_column == AnnotationTableModel.COL_LABEL:
+            return self._refresh()
+        for row in range(top_left.row(), bottom_right.row() + 1):
+            index = self.mapFromSource(self.sourceModel().index(row, 0))
+            if index.isValid():
+                self.dataChanged.emit(index, self.index(index.row(), self.columnCount() - 1), roles)
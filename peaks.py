@@ -0,0 +1,83 @@
+import numpy as np
+
+MIN_LEVEL = 4
+MIN_BUCKETS = 64
+
+
+class PeakPyramid:
+    def __init__(self, y=None, n_samples=None, min_level=MIN_LEVEL):
+        self.n_samples = len(y) if n_samples is None else n_samples
+        self.min_level = min_level
+        self.filled = 0
+        self.levels = []
+        self._allocate()
+        if y is not None and len(y):
+            self.update(y, 0, len(y))
+
+    def _allocate(self):
+        if self.n_samples == 0: return
+        count = -(-self.n_samples // (1 << self.min_level))
+        self.levels.append((np.zeros(count, dtype=np.float32), np.zeros(count, dtype=np.float32)))
+        while count > MIN_BUCKETS:
+            count = -(-count // 2)
+            self.levels.append((np.zeros(count, dtype=np.float32), np.zeros(count, dtype=np.float32)))
+
+    def update(self, y, start, stop):
+        # Recompute every bucket touched by samples [start, stop), including a partially filled tail
+        if not self.levels or stop <= start: return
+        size = 1 << self.min_level
+        b0 = start // size
+        first = b0 * size
+        idx = np.arange(0, stop - first, size)
+        mins, maxs = self.levels[0]
+        b1 = b0 + len(idx)
+        block = y[first:stop]
+        mins[b0:b1] = np.minimum.reduceat(block, idx)
+        maxs[b0:b1] = np.maximum.reduceat(block, idx)
+        for level in range(1, len(self.levels)):
+            prev_mins, prev_maxs = self.levels[level - 1]
+            mins, maxs = self.levels[level]
+            b0 //= 2
+            idx = np.arange(0, b1 - 2 * b0, 2)
+            mins[b0:b0 + len(idx)] = np.minimum.reduceat(prev_mins[2 * b0:b1], idx)
+            maxs[b0:b0 + len(idx)] = np.maximum.reduceat(prev_maxs[2 * b0:b1], idx)
+            b1 = b0 + len(idx)
+        self.filled = max(self.filled, stop)
+
+    def pack(self):
+        offsets = np.cumsum([0] + [len(mins) for mins, _ in self.levels])
+        packed = np.empty((2, offsets[-1]), dtype=np.float32)
+        for (mins, maxs), a, b in zip(self.levels, offsets[:-1], offsets[1:]):
+            packed[0, a:b] = mins
+            packed[1, a:b] = maxs
+        return packed, offsets
+
+    @classmethod
+    def unpack(cls, packed, offsets, n_samples, min_level=MIN_LEVEL):
+        pyramid = cls.__new__(cls)
+        pyramid.n_samples = n_samples
+        pyramid.min_level = min_level
+        pyramid.filled = n_samples
+        pyramid.levels = [(packed[0, a:b], packed[1, a:b]) for a, b in zip(offsets[:-1], offsets[1:])]
+        return pyramid
+
+    def bucket_size(self, level):
+        return 1 << (self.min_level + level)
+
+    def level_for(self, samples_per_px):
+        # Largest level that still has at least one bucket per pixel, -1 means raw samples
+        if samples_per_px < (1 << self.min_level) or not self.levels:
+            return -1
+        level = int(np.log2(samples_per_px)) - self.min_level
+        return min(level, len(self.levels) - 1)
+
+    def query(self, level, start, stop):
+        mins, maxs = self.levels[level]
+        size = self.bucket_size(level)
+        b0 = max(0, start // size)
+        b1 = min(len(mins), -(-min(stop, self.filled) // size))
+        return b0 * size, size, mins[b0:b1], maxs[b0:b1]
+
+    @property
+    def nbytes(self):
+        return sum(mins.nbytes + maxs.nbytes for mins, maxs in self.levels)
@@ -0,0 +1,213 @@
+import threading
+import collections
+import sounddevice as sd
+from stretch import Wsola
+
+BLOCK_SIZE = 512
+# Stretched output kept ready ahead of the callback, in output samples
+STRETCH_AHEAD = 2 * BLOCK_SIZE
+
+
+class PlaybackEngine:
+    def __init__(self, blocksize=BLOCK_SIZE):
+        self.blocksize = blocksize
+        self.stream = None
+        self.samples = None
+        self.sr = None
+        self.lock = threading.Lock()
+        self.wake = threading.Condition(self.lock)
+        self.playing = False
+        self.loop = False
+        self.speed = 1.0
+        self.pos = 0.0
+        self.start = 0
+        self.end = 0
+        self.underruns = 0
+        # (dac time of the first frame of the last block, sample position of that frame)
+        self._stamp = None
+
+        self.stretcher = None
+        self.chunks = collections.deque()
+        self.chunk_offset = 0
+        self.queued = 0
+        self.generation = 0
+        self.worker = None
+        self.running = False
+
+    def set_audio(self, samples, sr):
+        if samples is self.samples and sr == self.sr: return
+        with self.lock:
+            self.playing = False
+            self.samples = samples
+            self.stretcher = Wsola(samples, sr) if samples is not None else None
+            self._stamp = None
+            self._restart_stretch()
+        if self.stream is not None and self.stream.samplerate != sr:
+            self.close()
+        self.sr = sr
+
+    def _ensure_stream(self):
+        if self.stream is not None: return
+        self.stream = sd.OutputStream(samplerate=self.sr, channels=1, dtype='float32',
+                                      blocksize=self.blocksize, callback=self._callback)
+        self.running = True
+        self.worker = threading.Thread(target=self._fill_loop, daemon=True)
+        self.worker.start()
+        self.stream.start()
+
+    def close(self):
+        if self.stream is None: return
+        with self.lock:
+            self.running = False
+            self.wake.notify_all()
+        self.worker.join()
+        self.stream.abort()
+        self.stream.close()
+        self.stream = None
+
+    def play(self, start, end, loop=False):
+        if self.samples is None: return
+        end = min(end, len(self.samples))
+        if end <= start: return
+        self._ensure_stream()
+        with self.lock:
+            self.start = int(start)
+            self.end = int(end)
+            self.pos = float(start)
+            self.loop = loop
+            self._stamp = None
+            self.playing = True
+            self._restart_stretch()
+
+    def seek(self, index):
+        # Moves the play position without touching the stream or the fill thread; a range
+        # played without a loop grows back to an earlier index, a loop stays clamped
+        with self.lock:
+            if not self.loop:
+                self.start = min(self.start, int(index))
+            self.pos = float(min(max(index, self.start), self.end))
+            self._stamp = None
+            self._restart_stretch()
+
+    def stop(self):
+        with self.lock:
+            if self.playing:
+                self.pos = self._heard()
+            self.playing = False
+            self._stamp = None
+            self._restart_stretch()
+
+    def set_speed(self, speed):
+        with self.lock:
+            if speed == self.speed: return
+            was_direct = self.speed == 1.0
+            self.speed = speed
+            # Queued stretched hops keep playing and the worker uses the new speed from the
+            # next hop on; only switching to or from the direct path needs a restart
+            if was_direct or speed == 1.0:
+                self.pos = float(round(self.pos))
+                self._restart_stretch()
+
+    def set_loop(self, loop):
+        with self.lock:
+            self.loop = loop
+
+    def position(self):
+        with self.lock:
+            return self._heard() if self.playing else self.pos
+
+    def _heard(self):
+        # Sample index currently reaching the speakers, extrapolated from the last callback
+        if self._stamp is None or self.stream is None:
+            return self.pos
+        dac_time, pos = self._stamp
+        elapsed = max(0.0, self.stream.time - dac_time)
+        pos += elapsed * self.sr * self.speed
+        if self.loop and self.end > self.start and pos >= self.end:
+            pos = self.start + (pos - self.start) % (self.end - self.start)
+        return min(pos, self.end)
+
+    def _restart_stretch(self):
+        self.chunks.clear()
+        self.chunk_offset = 0
+        self.queued = 0
+        self.generation += 1
+        self.wake.notify_all()
+
+    def _fill_loop(self):
+        # Runs the time-stretch just ahead of the callback, one hop at a time
+        stretched_gen = None
+        while True:
+            with self.wake:
+                while self.running and not (self.playing and self.speed != 1.0 and self.queued < STRETCH_AHEAD):
+                    self.wake.wait(0.05)
+                if not self.running: return
+                stretcher = self.stretcher
+                if stretched_gen != self.generation:
+                    stretched_gen = self.generation
+                    stretcher.reset(self.pos)
+                gen, speed, start, end, loop = self.generation, self.speed, self.start, self.end, self.loop
+            hop = stretcher.next_hop(speed, start, end, loop)
+            with self.lock:
+                if gen != self.generation: continue
+                self.chunks.append((hop, speed))
+                if hop is not None:
+                    self.queued += len(hop[0])
+                else:
+                    self.queued = STRETCH_AHEAD
+
+    def _callback(self, outdata, frames, time_info, status):
+        if status.output_underflow:
+            self.underruns += 1
+        out = outdata[:, 0]
+        with self.lock:
+            if not self.playing or self.samples is None:
+                out.fill(0)
+                return
+            self._stamp = (time_info.outputBufferDacTime, self.pos)
+            written = 0
+            while written < frames:
+                if self.speed != 1.0:
+                    n = self._render_stretched(out[written:])
+                    if n == 0:
+                        out[written:] = 0
+                        break
+                    written += n
+                    continue
+                if self.pos >= self.end:
+                    if self.loop:
+                        self.pos = float(self.start)
+                        continue
+                    out[written:] = 0
+                    self.playing = False
+                    break
+                written += self._render(out[written:])
+
+    def _render(self, out):
+        pos = int(self.pos)
+        n = min(len(out), self.end - pos)
+        out[:n] = self.samples[pos:pos + n]
+        self.pos = float(pos + n)
+        return n
+
+    def _render_stretched(self, out):
+        if not self.chunks:
+            self.underruns += 1
+            return 0
+        hop, speed = self.chunks[0]
+        if hop is None:
+            self.playing = False
+            return 0
+        block, pos0 = hop
+        n = min(len(out), len(block) - self.chunk_offset)
+        out[:n] = block[self.chunk_offset:self.chunk_offset + n]
+        self.chunk_offset += n
+        self.queued -= n
+        self.pos = pos0 + self.chunk_offset * speed
+        if self.loop and self.pos >= self.end:
+            self.pos = self.start + (self.pos - self.end)
+        if self.chunk_offset == len(block):
+            self.chunks.popleft()
+            self.chunk_offset = 0
+        self.wake.notify()
+        return n
@@ -0,0 +1,64 @@
+import numpy as np
+
+FRAME_MS = 10
+BLOCK_FRAMES = 4096
+SILENT_DB = -120.0
+# Frames this far below the energy threshold still count when their zero-crossing rate is high,
+# which keeps quiet fricatives and noisy onsets attached to the louder part of an event
+ZCR_MARGIN_DB = 6.0
+ZCR_THRESHOLD = 0.25
+FLOOR_PERCENTILE = 10
+
+
+class FrameFeatures:
+    # Framewise RMS level (dBFS) and zero-crossing rate, filled in as samples become available
+    def __init__(self, n_samples, sr, frame_ms=FRAME_MS):
+        self.n_samples = n_samples
+        self.sr = sr
+        self.size = max(1, int(sr * frame_ms / 1000))
+        count = -(-n_samples // self.size)
+        self.rms_db = np.full(count, SILENT_DB, dtype=np.float32)
+        self.zcr = np.zeros(count, dtype=np.float32)
+        self.filled = 0
+
+    def update(self, y, stop):
+        # Only whole frames are computed, except the short last frame once the file is complete
+        size = self.size
+        end = len(self.rms_db) if stop >= self.n_samples else stop // size
+        for f0 in range(self.filled, end, BLOCK_FRAMES):
+            f1 = min(f0 + BLOCK_FRAMES, end)
+            whole = min(f1, self.n_samples // size)
+            if whole > f0:
+                self._compute(y[f0 * size:whole * size].reshape(-1, size), f0)
+            if f1 > whole:
+                self._compute(y[whole * size:self.n_samples][None, :], whole)
+            self.filled = f1
+
+    def _compute(self, frames, f0):
+        f1 = f0 + len(frames)
+        power = np.mean(np.square(frames, dtype=np.float32), axis=1)
+        self.rms_db[f0:f1] = 10 * np.log10(power + 1e-12)
+        signs = np.signbit(frames)
+        self.zcr[f0:f1] = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / max(1, frames.shape[1] - 1)
+
+
+def detect(features, threshold_db=12.0, min_duration=0.2, min_gap=0.15, zcr_threshold=ZCR_THRESHOLD):
+    # Returns (starts, ends) in seconds of runs louder than the noise floor by threshold_db;
+    # gaps shorter than min_gap are bridged and runs shorter than min_duration dropped
+    n = features.filled
+    if n == 0:
+        return np.empty(0), np.empty(0)
+    db = features.rms_db[:n]
+    level = np.percentile(db, FLOOR_PERCENTILE) + threshold_db
+    active = (db > level) | ((db > level - ZCR_MARGIN_DB) & (features.zcr[:n] > zcr_threshold))
+    edges = np.diff(active.astype(np.int8), prepend=0, append=0)
+    on = np.nonzero(edges == 1)[0]
+    off = np.nonzero(edges == -1)[0]
+    frame_s = features.size / features.sr
+    if len(on) > 1:
+        keep = (on[1:] - off[:-1]) * frame_s >= min_gap
+        on = np.concatenate([on[:1], on[1:][keep]])
+        off = np.concatenate([off[:-1][keep], off[-1:]])
+    long_enough = (off - on) * frame_s >= min_duration
+    on, off = on[long_enough], off[long_enough]
+    return on * frame_s, np.minimum(off * features.size, features.n_samples) / features.sr
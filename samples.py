@@ -0,0 +1,145 @@
+import numpy as np
+
+LAYOUTS = ("planar", "interleaved")
+INT16_SCALE = 1.0 / 32768
+# Source subtypes that int16 storage holds without loss
+INT16_SUBTYPES = ("PCM_16", "PCM_S8", "PCM_U8")
+
+
+def storage_dtype(subtype, setting="auto"):
+    # "auto" keeps 16-bit and narrower sources as int16 and everything else as float32
+    if setting == "int16" or (setting == "auto" and subtype in INT16_SUBTYPES):
+        return np.dtype(np.int16)
+    return np.dtype(np.float32)
+
+
+class SampleStore:
+    # Every channel of a file in one array, planar (channels, frames) or interleaved
+    # (frames, channels), float32 or int16 scaled by INT16_SCALE on read. Slicing the store
+    # gives float32 (frames, channels); view() gives the 1-D lanes the rest of the app reads
+    def __init__(self, data, sr, layout="planar"):
+        if layout not in LAYOUTS:
+            raise ValueError(f"unknown sample layout {layout!r}")
+        self.data = data
+        self.sr = sr
+        self.layout = layout
+        self.views = {}
+
+    @classmethod
+    def allocate(cls, frames, channels, sr, dtype=np.float32, layout="planar"):
+        shape = (channels, frames) if layout == "planar" else (frames, channels)
+        return cls(np.zeros(shape, dtype=dtype), sr, layout)
+
+    @property
+    def channels(self):
+        return self.data.shape[0] if self.layout == "planar" else self.data.shape[1]
+
+    @property
+    def n_frames(self):
+        return self.data.shape[1] if self.layout == "planar" else self.data.shape[0]
+
+    @property
+    def dtype(self):
+        return self.data.dtype
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes
+
+    def __len__(self):
+        return self.n_frames
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            raise TypeError("SampleStore only supports slices")
+        return self._to_float(self.raw(key))
+
+    def raw(self, key):
+        # (frames, channels) in the storage dtype
+        return self.data[:, key].T if self.layout == "planar" else self.data[key]
+
+    def _to_float(self, block):
+        if block.dtype == np.int16:
+            return block.astype(np.float32) * np.float32(INT16_SCALE)
+        return np.asarray(block, dtype=np.float32)
+
+    def lane(self, channel):
+        # Stored samples of one channel: contiguous when planar, strided when interleaved
+        return self.data[channel] if self.layout == "planar" else self.data[:, channel]
+
+    def view(self, channel=None):
+        # 1-D float32 samples of one channel, or the mean of all channels for None. A float32
+        # lane is a plain array view; anything that has to be scaled or mixed is a LaneView
+        if channel is None and self.channels == 1:
+            channel = 0
+        if channel not in self.views:
+            if channel is not None and self.dtype == np.float32:
+                self.views[channel] = self.lane(channel)
+            else:
+                self.views[channel] = LaneView(self, channel)
+        return self.views[channel]
+
+    def read(self, start, stop, channel=None):
+        if channel is not None:
+            return self._to_float(self.lane(channel)[start:stop])
+        block = self.data[:, start:stop] if self.layout == "planar" else self.data[start:stop].T
+        mix = block.mean(axis=0, dtype=np.float32)
+        return mix * np.float32(INT16_SCALE) if self.dtype == np.int16 else mix
+
+    def write(self, start, block):
+        # block is (frames, channels), either already in the storage dtype or float
+        if self.dtype == np.int16 and block.dtype != np.int16:
+            block = np.clip(np.round(block * 32768), -32768, 32767).astype(np.int16)
+        stop = start + len(block)
+        if self.layout == "planar":
+            self.data[:, start:stop] = block.T
+        else:
+            self.data[start:stop] = block
+
+    def merged(self, other, shift):
+        # One store covering this one and other, whose first frame is shift frames after ours
+        first = min(0, shift)
+        last = max(self.n_frames, shift + other.n_frames)
+        out = SampleStore.allocate(last - first, self.channels, self.sr, self.dtype, self.layout)
+        out.write(-first, self.raw(slice(None)))
+        out.write(shift - first, other.raw(slice(None)))
+        return out
+
+    def truncate(self, frames):
+        data = self.data[:, :frames] if self.layout == "planar" else self.data[:frames]
+        return SampleStore(data, self.sr, self.layout)
+
+
+class LaneView:
+    # Read-only 1-D float32 sequence over a SampleStore; only the requested slice is converted
+    dtype = np.dtype(np.float32)
+    ndim = 1
+
+    def __init__(self, store, channel=None):
+        self.store = store
+        self.channel = channel
+
+    def __len__(self):
+        return self.store.n_frames
+
+    @property
+    def shape(self):
+        return (len(self),)
+
+    @property
+    def nbytes(self):
+        return self.store.nbytes
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            block = self.store.read(start, max(start, stop), self.channel)
+            return block[::step] if step != 1 else block
+        if isinstance(key, (int, np.integer)):
+            index = key + len(self) if key < 0 else key
+            return self.store.read(index, index + 1, self.channel)[0]
+        return np.asarray(self)[key]
+
+    def __array__(self, dtype=None, copy=None):
+        samples = self[:]
+        return samples if dtype is None else samples.astype(dtype)
@@ -0,0 +1,135 @@
+import os
+import csv
+import collections
+from PyQt6.QtCore import QObject, QThread, pyqtSignal
+from config import SESSION_MEMORY_BYTES, SESSION_PREFETCH
+from decoders import AUDIO_EXTENSIONS
+from workers import AudioLoaderThread
+
+
+def list_audio_files(path):
+    # A directory is scanned for audio files; any other file is read as a manifest with one
+    # path per line (or per row, first column, for .csv), relative to the manifest's folder
+    if os.path.isdir(path):
+        names = sorted(n for n in os.listdir(path) if n.lower().endswith(AUDIO_EXTENSIONS))
+        return [os.path.join(path, n) for n in names]
+    base = os.path.dirname(os.path.abspath(path))
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        if path.lower().endswith(".csv"):
+            entries = [row[0] for row in csv.reader(f) if row]
+        else:
+            entries = [line for line in f if not line.startswith("#")]
+    files = (os.path.join(base, os.path.expanduser(e.strip())) for e in entries if e.strip())
+    # Also drops a header row or a stale entry
+    return [p for p in files if os.path.isfile(p)]
+
+
+class DecodedMemory:
+    # LRU of decoded files (samples and peak pyramid) capped by their total size in bytes
+    def __init__(self, max_bytes=SESSION_MEMORY_BYTES):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.entries = collections.OrderedDict()
+
+    def __contains__(self, path):
+        return path in self.entries
+
+    def get(self, path):
+        entry = self.entries.get(path)
+        if entry is not None:
+            self.entries.move_to_end(path)
+        return entry
+
+    def put(self, path, store, sr, pyramid):
+        self.discard(path)
+        size = store.nbytes + pyramid.nbytes
+        self.entries[path] = (store, sr, pyramid, size)
+        self.nbytes += size
+        while self.nbytes > self.max_bytes and len(self.entries) > 1:
+            _, evicted = self.entries.popitem(last=False)
+            self.nbytes -= evicted[3]
+
+    def discard(self, path):
+        entry = self.entries.pop(path, None)
+        if entry is not None:
+            self.nbytes -= entry[3]
+
+    def clear(self):
+        self.entries.clear()
+        self.nbytes = 0
+
+
+class FileSession(QObject):
+    # File queue for working through a folder; decodes the next few files in the background
+    ready = pyqtSignal(str)
+    failed = pyqtSignal(str, str)
+    progress = pyqtSignal(str, int)
+
+    def __init__(self, cache=None, prefetch=SESSION_PREFETCH, parent=None):
+        super().__init__(parent)
+        self.cache = cache
+        self.prefetch = prefetch
+        self.files = []
+        self.index = -1
+        self.memory = DecodedMemory()
+        self.workers = {}
+        self.errors = set()
+
+    def open(self, path):
+        self.shutdown()
+        self.files = list_audio_files(path)
+        self.index = -1
+        self.errors.clear()
+        return self.files
+
+    def set_current(self, path):
+        self.index = self.files.index(path) if path in self.files else -1
+        self.schedule()
+
+    def next_path(self, step=1):
+        i = self.index + step
+        return self.files[i] if 0 <= i < len(self.files) else None
+
+    def is_loading(self, path):
+        return path in self.workers
+
+    def remember(self, path, store, sr, pyramid):
+        self.memory.put(path, store, sr, pyramid)
+
+    def schedule(self):
+        # One background decode at a time so the file being labelled keeps the disk and CPU
+        if self.workers or self.index < 0: return
+        for path in self.files[self.index + 1:self.index + 1 + self.prefetch]:
+            if path in self.memory or path in self.errors: continue
+            worker = AudioLoaderThread(path, self.cache)
+            worker.progress.connect(lambda percent, p=path: self.progress.emit(p, percent))
+            worker.finished_loading.connect(self.on_loaded)
+            worker.error_occurred.connect(self.on_error)
+            worker.finished.connect(self.on_worker_finished)
+            self.workers[path] = worker
+            worker.start(QThread.Priority.LowPriority)
+            return
+
+    def on_loaded(self, store, sr, duration, pyramid):
+        path = self.sender().path
+        self.memory.put(path, store, sr, pyramid)
+        self.ready.emit(path)
+
+    def on_error(self, err_msg):
+        path = self.sender().path
+        self.errors.add(path)
+        self.failed.emit(path, err_msg)
+
+    def on_worker_finished(self):
+        worker = self.sender()
+        if self.workers.get(worker.path) is worker:
+            del self.workers[worker.path]
+        self.schedule()
+
+    def shutdown(self):
+        self.index = -1
+        for worker in self.workers.values():
+            worker.requestInterruption()
+        for worker in self.workers.values():
+            worker.wait()
+        self.workers.clear()
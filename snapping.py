@@ -0,0 +1,79 @@
+import numpy as np
+
+# Samples searched on each side of a snap target before the window doubles
+SEARCH_SAMPLES = 1 << 10
+# Furthest a cut moves to reach a crossing: one period at 20 Hz, so any audible signal has one
+CROSSING_RADIUS_S = 0.05
+# Frame-to-frame level change that counts as an onset (rise) or offset (fall)
+BOUNDARY_DB = 9.0
+FLOOR_PERCENTILE = 10
+
+
+def zero_crossings(y, lo=0, hi=None):
+    # Sample indices in [lo, hi) where the signal rises through zero; rising edges only still
+    # give a click-free cut point every period
+    hi = len(y) if hi is None else min(hi, len(y))
+    lo = max(lo, 1)
+    if hi <= lo:
+        return np.empty(0, dtype=np.int64)
+    neg = np.signbit(np.asarray(y[lo - 1:hi]))
+    return np.nonzero(neg[:-1] & ~neg[1:])[0] + lo
+
+
+def boundaries(features):
+    # Frame starts where the level jumps by BOUNDARY_DB or more, at the local peak of the change
+    db = features.rms_db[:features.filled]
+    if len(db) < 3:
+        return np.empty(0)
+    floor = np.percentile(db, FLOOR_PERCENTILE)
+    flux = np.abs(np.diff(db))
+    peak = (flux[1:-1] >= flux[:-2]) & (flux[1:-1] >= flux[2:])
+    loud = np.maximum(db[1:-2], db[2:-1]) > floor + BOUNDARY_DB
+    frames = np.nonzero(peak & loud & (flux[1:-1] >= BOUNDARY_DB))[0] + 2
+    return frames * features.size / features.sr
+
+
+class SnapIndex:
+    def __init__(self, samples, sr, features, offset=0):
+        # offset is the file position of samples[0]; snapped times are file times
+        self.sr = sr
+        self.start = offset / sr
+        # Crossings are looked up around each snap instead of stored: noisy audio has one every
+        # few samples, hundreds of MB per hour at 48 kHz
+        self.samples = samples
+        self.boundaries = boundaries(features) + self.start
+
+    @staticmethod
+    def _nearest(values, x):
+        # x must have the dtype of values, otherwise searchsorted converts the whole array
+        i = int(np.searchsorted(values, x))
+        best = None
+        for j in (i - 1, i):
+            if 0 <= j < len(values) and (best is None or abs(values[j] - x) < abs(best - x)):
+                best = values[j]
+        return best
+
+    def nearest_crossing(self, index, limit):
+        # Nearest rising crossing within limit samples of index. The window is centred on index,
+        # so the closest crossing in it is the closest overall; it doubles until one turns up
+        half = min(SEARCH_SAMPLES, limit)
+        while True:
+            found = zero_crossings(self.samples, index - half, index + half + 1)
+            if len(found):
+                return int(found[np.argmin(np.abs(found - index))])
+            if half >= limit:
+                return None
+            half = min(2 * half, limit)
+
+    def snap(self, t, radius):
+        # An onset or offset within radius wins, then the edge moves to a zero crossing close
+        # to it so the cut does not click; with neither in range t is returned unchanged
+        b = self._nearest(self.boundaries, np.float64(t))
+        if b is not None and abs(b - t) <= radius:
+            t = float(b)
+            radius /= 4
+        limit = int(min(radius, CROSSING_RADIUS_S) * self.sr)
+        z = self.nearest_crossing(round((t - self.start) * self.sr), limit)
+        if z is not None and abs(self.start + z / self.sr - t) <= radius:
+            return self.start + z / self.sr
+        return t
@@ -0,0 +1,100 @@
+import threading
+import collections
+import numpy as np
+
+N_FFT = 1024
+TILE_FRAMES = 256
+MIN_LEVEL = 5
+MAX_LEVEL = 20
+DB_RANGE = 100.0
+TILE_CACHE_BYTES = 256 * 1024 ** 2
+# View widths in pixels whose whole-file levels are worth precomputing
+OVERVIEW_WIDTHS = (512, 4096)
+
+
+def level_for(samples_per_px):
+    # Hop of 2^level samples, roughly one STFT frame per pixel
+    level = int(np.log2(max(1.0, samples_per_px)))
+    return min(max(level, MIN_LEVEL), MAX_LEVEL)
+
+
+def tile_span(level, index, frames=TILE_FRAMES):
+    hop = 1 << level
+    return index * frames * hop, (index + 1) * frames * hop
+
+
+def _read(samples, first, last):
+    # samples[first:last] as float32, zero where the range runs past either end of the file
+    out = np.zeros(last - first, dtype=np.float32)
+    a, b = max(first, 0), min(last, len(samples))
+    if b > a:
+        out[a - first:b - first] = samples[a:b]
+    return out
+
+
+def frame_windows(samples, centers, n_fft=N_FFT):
+    # (len(centers), n_fft) samples centred on each frame. Overlapping windows come from one
+    # contiguous read; past a hop of n_fft only the windows are read, not the gaps between them
+    half = n_fft // 2
+    hop = int(centers[1] - centers[0]) if len(centers) > 1 else n_fft
+    if hop < n_fft:
+        segment = _read(samples, int(centers[0]) - half, int(centers[-1]) + half)
+        return segment[(centers - centers[0])[:, None] + np.arange(n_fft)]
+    out = np.empty((len(centers), n_fft), dtype=np.float32)
+    for row, c in enumerate(centers):
+        out[row] = _read(samples, int(c) - half, int(c) + half)
+    return out
+
+
+def compute_tile(samples, level, index, n_fft=N_FFT, frames=TILE_FRAMES):
+    # Returns (frames, n_fft // 2 + 1) uint8 dB image, 0 = -DB_RANGE dB and 255 = 0 dB full scale
+    hop = 1 << level
+    centers = (index * frames + np.arange(frames)) * hop
+    window = np.hanning(n_fft).astype(np.float32)
+    spec = np.abs(np.fft.rfft(frame_windows(samples, centers, n_fft) * window, axis=1))
+    db = 20 * np.log10(spec / (window.sum() / 2) + 1e-10)
+    return np.clip((db + DB_RANGE) * (255 / DB_RANGE), 0, 255).astype(np.uint8)
+
+
+def overview_levels(n_samples):
+    # Levels shown when the whole file fits a view between OVERVIEW_WIDTHS pixels wide
+    lo = level_for(n_samples / OVERVIEW_WIDTHS[1])
+    hi = level_for(n_samples / OVERVIEW_WIDTHS[0])
+    return list(range(lo, hi + 1))
+
+
+def compute_level(samples, level):
+    # Every tile of one level stacked into a single (n_tiles * TILE_FRAMES, bins) image
+    n_tiles = max(1, -(-len(samples) // (TILE_FRAMES << level)))
+    return np.concatenate([compute_tile(samples, level, i) for i in range(n_tiles)])
+
+
+class TileCache:
+    def __init__(self, max_bytes=TILE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.tiles = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            tile = self.tiles.get(key)
+            if tile is not None:
+                self.tiles.move_to_end(key)
+            return tile
+
+    def put(self, key, tile):
+        with self.lock:
+            old = self.tiles.pop(key, None)
+            if old is not None:
+                self.nbytes -= old.nbytes
+            self.tiles[key] = tile
+            self.nbytes += tile.nbytes
+            while self.nbytes > self.max_bytes and len(self.tiles) > 1:
+                _, evicted = self.tiles.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+
+    def clear(self):
+        with self.lock:
+            self.tiles.clear()
+            self.nbytes = 0
@@ -0,0 +1,54 @@
+import numpy as np
+
+FRAME_MS = 40
+TOLERANCE_MS = 10
+
+
+class Wsola:
+    def __init__(self, samples, sr, frame_ms=FRAME_MS, tolerance_ms=TOLERANCE_MS):
+        self.samples = samples
+        self.frame = 2 * max(16, int(sr * frame_ms / 2000))
+        self.hop = self.frame // 2
+        self.tolerance = max(1, int(sr * tolerance_ms / 1000))
+        # Periodic Hann sums to one at 50% overlap
+        self.window = np.hanning(self.frame + 1)[:-1].astype(np.float32)
+        self.fft_size = 1 << int(np.ceil(np.log2(self.frame + 2 * self.tolerance)))
+        self.reset(0)
+
+    def reset(self, pos):
+        self.in_pos = float(pos)
+        self.prev = None
+        self.tail = np.zeros(self.hop, dtype=np.float32)
+
+    def _segment(self, start, length, lo, hi):
+        out = np.zeros(length, dtype=np.float32)
+        a, b = max(start, lo), min(start + length, hi)
+        if b > a:
+            out[a - start:b - start] = self.samples[a:b]
+        return out
+
+    def _best_offset(self, template, search_start, lo, hi):
+        region = self._segment(search_start, self.frame + 2 * self.tolerance, lo, hi)
+        spectrum = np.fft.rfft(region, self.fft_size) * np.conj(np.fft.rfft(template, self.fft_size))
+        corr = np.fft.irfft(spectrum, self.fft_size)[:2 * self.tolerance + 1]
+        return search_start + int(np.argmax(corr))
+
+    def next_hop(self, speed, lo, hi, loop=False):
+        # Returns one hop of output and the input position it starts at, or None once past hi
+        if self.in_pos >= hi:
+            if not loop or hi <= lo: return None
+            self.in_pos = lo + (self.in_pos - hi)
+            self.prev = None
+        nominal = int(self.in_pos)
+        if self.prev is None:
+            best = nominal
+        else:
+            natural = self._segment(self.prev + self.hop, self.frame, lo, hi)
+            best = self._best_offset(natural, nominal - self.tolerance, lo, hi)
+        frame = self._segment(best, self.frame, lo, hi) * self.window
+        out = self.tail + frame[:self.hop]
+        self.tail = frame[self.hop:]
+        self.prev = best
+        pos = self.in_pos
+        self.in_pos += self.hop * speed
+        return out, pos
@@ -0,0 +1,96 @@
+import numpy as np
+
+TILE_PX = 256
+# Level k draws 2^k samples per pixel; negative levels are zoomed in past single samples
+MIN_LEVEL = -6
+MAX_LEVEL = 24
+TILE_CACHE_BYTES = 192 * 1024 ** 2
+
+
+def level_for(samples_per_px):
+    level = int(round(np.log2(max(samples_per_px, 1e-12))))
+    return min(max(level, MIN_LEVEL), MAX_LEVEL)
+
+
+def file_level(n_samples, width=TILE_PX):
+    # Coarsest level worth drawing: one tile already spans all n_samples
+    level = int(np.ceil(np.log2(max(n_samples, 1) / width))) if n_samples > width else 0
+    return min(max(level, 0), MAX_LEVEL)
+
+
+def tile_span(level, index, width=TILE_PX):
+    # First and last sample position covered by a tile; fractional below level 0
+    spp = 2.0 ** level
+    return index * width * spp, (index + 1) * width * spp
+
+
+def _binned(samples, pyramid, level, index, available, width):
+    # Exact min/max over bins of 2^level samples, from the coarsest pyramid level that divides a bin
+    spp = 1 << level
+    bucket, mins, maxs = 1, samples, samples
+    if pyramid is not None and pyramid.levels and level >= pyramid.min_level:
+        top = min(level - pyramid.min_level, len(pyramid.levels) - 1)
+        bucket = pyramid.bucket_size(top)
+        mins, maxs = pyramid.levels[top]
+        available = min(len(mins), -(-available // bucket))
+    group = spp // bucket
+    b0 = index * width * group
+    b1 = min(b0 + width * group, available)
+    lo = np.full(width * group, np.inf, dtype=np.float32)
+    hi = np.full(width * group, -np.inf, dtype=np.float32)
+    if b1 > b0:
+        lo[:b1 - b0] = mins[b0:b1]
+        hi[:b1 - b0] = maxs[b0:b1]
+    return lo.reshape(width, group).min(axis=1), hi.reshape(width, group).max(axis=1)
+
+
+def _interpolated(samples, level, index, available, width):
+    # Fewer samples than pixels: the polyline through the samples, column by column
+    spp = 2.0 ** level
+    edges = index * width * spp + np.arange(width + 1) * spp
+    lo = np.full(width, np.inf, dtype=np.float32)
+    hi = np.full(width, -np.inf, dtype=np.float32)
+    a = max(0, int(edges[0]))
+    b = min(available, int(np.ceil(edges[-1])) + 1)
+    if b - a < 2:
+        return lo, hi
+    x = np.arange(a, b)
+    y = np.asarray(samples[a:b], dtype=np.float32)
+    inside = (edges >= a) & (edges <= b - 1)
+    at_edges = np.interp(edges, x, y).astype(np.float32)
+    ok = inside[:-1] & inside[1:]
+    lo[ok] = np.minimum(at_edges[:-1], at_edges[1:])[ok]
+    hi[ok] = np.maximum(at_edges[:-1], at_edges[1:])[ok]
+    # Sample points inside a column are the vertices of the line
+    cols = ((x - edges[0]) / spp).astype(np.int64)
+    keep = (cols >= 0) & (cols < width)
+    np.minimum.at(lo, cols[keep], y[keep])
+    np.maximum.at(hi, cols[keep], y[keep])
+    return lo, hi
+
+
+def envelope(samples, pyramid, level, index, available, width=TILE_PX):
+    # Per-pixel (lo, hi) of the drawn line; columns without data have lo > hi
+    if level >= 0:
+        lo, hi = _binned(samples, pyramid, level, index, available, width)
+    else:
+        lo, hi = _interpolated(samples, level, index, available, width)
+    # Stretch each column to meet its neighbours so the trace has no gaps
+    valid = lo <= hi
+    joined = valid[1:] & valid[:-1]
+    lo2, hi2 = lo.copy(), hi.copy()
+    lo2[1:][joined] = np.minimum(lo[1:], hi[:-1])[joined]
+    hi2[1:][joined] = np.maximum(hi[1:], lo[:-1])[joined]
+    return lo2, hi2
+
+
+def rasterize(lo, hi, height, y_range, color):
+    # (height, width) uint32 premultiplied ARGB: color where the trace is, transparent elsewhere
+    y0, y1 = y_range
+    scale = height / (y1 - y0)
+    valid = lo <= hi
+    top = np.floor((y1 - np.where(valid, hi, 0)) * scale)
+    bottom = np.maximum(np.ceil((y1 - np.where(valid, lo, 0)) * scale), top + 1)
+    rows = np.arange(height, dtype=np.float32)[:, None]
+    mask = (rows >= top) & (rows < bottom) & valid
+    return np.where(mask, np.uint32(color), np.uint32(0))
@@ -1,8 +1,17 @@
+import os
+import math
+import collections
+import time
+import numpy as np
 import pyqtgraph as pg
-from PyQt6.QtCore import Qt, pyqtSignal
-from PyQt6.QtGui import QMouseEvent, QCursor
-from PyQt6.QtWidgets import QApplication
+from concurrent.futures import ThreadPoolExecutor
+from PyQt6.QtCore import Qt, QObject, QPointF, QRectF, QTimer, pyqtSignal
+from PyQt6.QtGui import QMouseEvent, QCursor, QColor, QFontMetricsF, QGuiApplication, QImage, QPainter, QPainterPath, QPen, QPixmap, QWheelEvent
+from PyQt6.QtWidgets import QApplication, QLabel
+import instrument
 from config import THEME
+from spectrogram import N_FFT, TILE_FRAMES, TileCache, compute_tile, level_for, tile_span
+import waveform
 
 class TimeAxisItem(pg.AxisItem):
     def tickStrings(self, values, scale, spacing):
@@ -18,13 +27,708 @@ class TimeAxisItem(pg.AxisItem):
                 strings.append(f"{minutes:02d}:{seconds:02d}")
         return strings
 
+class PixmapCache:
+    # LRU of rendered tiles bounded by their pixel memory; GUI thread only, like QPixmap itself
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.pixmaps = collections.OrderedDict()
+
+    @staticmethod
+    def size_of(pixmap):
+        return pixmap.width() * pixmap.height() * pixmap.depth() // 8
+
+    def get(self, key):
+        pixmap = self.pixmaps.get(key)
+        if pixmap is not None:
+            self.pixmaps.move_to_end(key)
+        return pixmap
+
+    def put(self, key, pixmap):
+        old = self.pixmaps.pop(key, None)
+        if old is not None:
+            self.nbytes -= self.size_of(old)
+        self.pixmaps[key] = pixmap
+        self.nbytes += self.size_of(pixmap)
+        while self.nbytes > self.max_bytes and len(self.pixmaps) > 1:
+            _, evicted = self.pixmaps.popitem(last=False)
+            self.nbytes -= self.size_of(evicted)
+
+    def clear(self):
+        self.pixmaps.clear()
+        self.nbytes = 0
+
+
+class WaveformItem(pg.GraphicsObject):
+    # The trace is rasterized into fixed-width tiles per zoom level by worker threads; painting
+    # only blits cached pixmaps and a missing tile is drawn once it arrives
+    tile_ready = pyqtSignal(object, object, object, bool)
+    PREFETCH = 2
+
+    def __init__(self, color, y_range=(-1.1, 1.1)):
+        super().__init__()
+        self.samples = None
+        self.sr = 1
+        self.offset = 0
+        self.pyramid = None
+        self.y_range = y_range
+        self.color = QColor(color).rgba()
+        self.generation = 0
+        self.cache = PixmapCache(waveform.TILE_CACHE_BYTES)
+        self.pool = ThreadPoolExecutor(max_workers=max(1, (os.cpu_count() or 2) // 2))
+        self.pending = {}
+        self.shown = {}
+        self.visible_keys = set()
+        self.level = None
+        self.height_px = 0
+        self.tile_ready.connect(self.on_tile_ready)
+
+    def set_audio(self, y, sr, pyramid, offset=0):
+        if y is not self.samples or sr != self.sr or offset != self.offset:
+            self._reset()
+        self.prepareGeometryChange()
+        self.samples = y
+        self.sr = sr
+        self.offset = offset
+        self.pyramid = pyramid
+        self.informViewBoundsChanged()
+        self.update_view()
+
+    def clear_audio(self):
+        self._reset()
+        self.prepareGeometryChange()
+        self.samples = None
+        self.pyramid = None
+        self.update()
+
+    def shutdown(self):
+        self._reset()
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+    def _reset(self):
+        self.generation += 1
+        for future in self.pending.values():
+            future.cancel()
+        self.pending.clear()
+        self.cache.clear()
+        self.shown.clear()
+        self.visible_keys = set()
+
+    def available(self):
+        if self.pyramid is None:
+            return len(self.samples)
+        return min(len(self.samples), self.pyramid.filled)
+
+    def dataBounds(self, ax, frac=1.0, orthoRange=None):
+        if self.samples is None or len(self.samples) == 0:
+            return (None, None)
+        if ax == 0:
+            return (self.offset / self.sr, (self.offset + len(self.samples)) / self.sr)
+        return (-1.0, 1.0)
+
+    def boundingRect(self):
+        if self.samples is None:
+            return QRectF()
+        y0, y1 = self.y_range
+        return QRectF(self.offset / self.sr, y0, len(self.samples) / self.sr, y1 - y0)
+
+    def viewRangeChanged(self):
+        self.update_view()
+
+    def viewTransformChanged(self):
+        # A resize changes the tile height without changing the range
+        super().viewTransformChanged()
+        vb = self.getViewBox()
+        if vb is not None and self.height_px != max(1, int(vb.height())):
+            self.update_view()
+
+    def tile_rect(self, level, index):
+        a, b = waveform.tile_span(level, index)
+        y0, y1 = self.y_range
+        return QRectF((a + self.offset) / self.sr, y0, (b - a) / self.sr, y1 - y0)
+
+    @instrument.timed("waveform.update_view")
+    def update_view(self):
+        vb = self.getViewBox()
+        if self.samples is None or vb is None: return
+        n = self.available()
+        if n == 0: return
+        x_min, x_max = vb.viewRange()[0]
+        width_px = max(1, int(vb.width()))
+        height = max(1, int(vb.height()))
+        level = waveform.level_for((x_max - x_min) * self.sr / width_px)
+        level = min(level, waveform.file_level(len(self.samples)))
+        span = waveform.tile_span(level, 1)[0]
+        last = int((n - 1) // span)
+        i0 = max(0, int((x_min * self.sr - self.offset) // span))
+        i1 = min(last, int((x_max * self.sr - self.offset) // span))
+        self.level = level
+        self.height_px = height
+        self.visible_keys = {(level, i, height) for i in range(i0, i1 + 1)}
+
+        for key in sorted(self.visible_keys):
+            pixmap = self.cache.get(key)
+            if pixmap is not None:
+                self.shown[key[:2]] = (pixmap, height)
+            else:
+                self._request(key, n)
+        for i in list(range(i0 - self.PREFETCH, i0)) + list(range(i1 + 1, i1 + 1 + self.PREFETCH)):
+            key = (level, i, height)
+            if 0 <= i <= last and key not in self.cache.pixmaps:
+                self._request(key, n)
+        self._prune(x_min, x_max)
+        self.update()
+
+    def _prune(self, x_min, x_max):
+        # Tiles of other levels or sizes stay as a backdrop until the current ones cover the view
+        current = {key[:2] for key in self.visible_keys}
+        done = all(key[:2] in self.shown and self.shown[key[:2]][1] == key[2] for key in self.visible_keys)
+        for tile in list(self.shown):
+            if tile in current: continue
+            rect = self.tile_rect(*tile)
+            if done or rect.right() < x_min or rect.left() > x_max:
+                del self.shown[tile]
+
+    def _request(self, key, n):
+        if key in self.pending: return
+        level, index, _ = key
+        complete = n == len(self.samples) or waveform.tile_span(level, index)[1] <= n
+        self.pending[key] = self.pool.submit(self._render, self.generation, self.samples, self.pyramid, key, n, complete)
+
+    def _render(self, generation, samples, pyramid, key, n, complete):
+        level, index, height = key
+        with instrument.span("waveform.tile", level=level):
+            lo, hi = waveform.envelope(samples, pyramid, level, index, n)
+            argb = waveform.rasterize(lo, hi, height, self.y_range, self.color)
+            image = QImage(argb.data, waveform.TILE_PX, height, waveform.TILE_PX * 4,
+                           QImage.Format.Format_ARGB32_Premultiplied).copy()
+        self.tile_ready.emit(generation, key, image, complete)
+
+    def on_tile_ready(self, generation, key, image, complete):
+        if generation != self.generation: return
+        self.pending.pop(key, None)
+        pixmap = QPixmap.fromImage(image)
+        if complete:
+            self.cache.put(key, pixmap)
+        if key in self.visible_keys:
+            self.shown[key[:2]] = (pixmap, key[2])
+            vb = self.getViewBox()
+            if vb is not None:
+                self._prune(*vb.viewRange()[0])
+            self.update()
+
+    def paint(self, p, *args):
+        if not self.shown: return
+        # Blitted in device coordinates: row 0 of a tile is the top of y_range
+        tr = p.transform()
+        p.resetTransform()
+        p.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform)
+        for (level, index), (pixmap, _) in sorted(self.shown.items(), key=lambda item: item[0][0] == self.level):
+            p.drawPixmap(tr.mapRect(self.tile_rect(level, index)), pixmap, QRectF(pixmap.rect()))
+        p.setTransform(tr)
+
+
+class SpectrogramItem(pg.GraphicsObject):
+    tile_ready = pyqtSignal(object, object, object, bool)
+    PREFETCH = 2
+
+    def __init__(self):
+        super().__init__()
+        self.samples = None
+        self.sr = 1
+        self.offset = 0
+        self.available = 0
+        self.generation = 0
+        self.cache = TileCache()
+        self.precomputed = {}
+        self.pool = ThreadPoolExecutor(max_workers=max(1, (os.cpu_count() or 2) // 2))
+        self.pending = {}
+        self.images = {}
+        self.visible_keys = set()
+        self.lut = pg.colormap.get('inferno').getLookupTable(nPts=256)
+        self.tile_ready.connect(self.on_tile_ready)
+
+    def set_audio(self, samples, sr, available=None, offset=0):
+        # offset is the file position of the first sample, in samples
+        if samples is not self.samples or sr != self.sr or offset != self.offset:
+            self._reset()
+        self.prepareGeometryChange()
+        self.samples = samples
+        self.sr = sr
+        self.offset = offset
+        self.available = len(samples) if available is None else available
+        self.update_view()
+
+    def set_available(self, available):
+        self.available = available
+        self.update_view()
+
+    def set_precomputed(self, levels):
+        # Whole levels from the decode cache; tiles are sliced from them instead of computed
+        self.precomputed = levels
+        self.update_view()
+
+    def clear_audio(self):
+        self._reset()
+        self.prepareGeometryChange()
+        self.samples = None
+
+    def shutdown(self):
+        self._reset()
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+    def _reset(self):
+        self.generation += 1
+        for future in self.pending.values():
+            future.cancel()
+        self.pending.clear()
+        self.cache.clear()
+        self.precomputed = {}
+        for image, _ in self.images.values():
+            image.setParentItem(None)
+            if image.scene() is not None:
+                image.scene().removeItem(image)
+        self.images.clear()
+        self.visible_keys = set()
+
+    def boundingRect(self):
+        if self.samples is None:
+            return QRectF()
+        return QRectF(self.offset / self.sr, 0, len(self.samples) / self.sr, self.sr / 2)
+
+    def paint(self, p, *args):
+        pass
+
+    def viewRangeChanged(self):
+        self.update_view()
+
+    def itemChange(self, change, value):
+        ret = super().itemChange(change, value)
+        if change == self.GraphicsItemChange.ItemVisibleHasChanged and value:
+            self.update_view()
+        return ret
+
+    def update_view(self):
+        vb = self.getViewBox()
+        if self.samples is None or vb is None or not self.isVisible() or self.available <= 0: return
+        x_min, x_max = vb.viewRange()[0]
+        width_px = max(1, int(vb.width()))
+        level = level_for((x_max - x_min) * self.sr / width_px)
+        tile_samples = TILE_FRAMES << level
+        last = (self.available - 1) // tile_samples
+        i0 = max(0, int((x_min * self.sr - self.offset) // tile_samples))
+        i1 = min(last, int((x_max * self.sr - self.offset) // tile_samples))
+
+        self.visible_keys = {(level, i) for i in range(i0, i1 + 1)}
+        for key in list(self.images):
+            if key not in self.visible_keys:
+                image, _ = self.images.pop(key)
+                image.setParentItem(None)
+                if image.scene() is not None:
+                    image.scene().removeItem(image)
+
+        for key in sorted(self.visible_keys):
+            if key in self.images and self.images[key][1]: continue
+            tile = self._cached(key)
+            if tile is not None:
+                self._show(key, tile, True)
+            else:
+                self._request(key)
+        for i in list(range(i0 - self.PREFETCH, i0)) + list(range(i1 + 1, i1 + 1 + self.PREFETCH)):
+            if 0 <= i <= last and self._cached((level, i)) is None:
+                self._request((level, i))
+
+    def _cached(self, key):
+        # GUI thread only, like every put: the cache never holds tiles of an earlier generation
+        tile = self.cache.get(key)
+        image = self.precomputed.get(key[0])
+        if tile is None and image is not None:
+            rows = image[key[1] * TILE_FRAMES:(key[1] + 1) * TILE_FRAMES]
+            if len(rows) == TILE_FRAMES:
+                tile = np.array(rows)
+                self.cache.put(key, tile)
+        return tile
+
+    def _request(self, key):
+        if key in self.pending: return
+        level, index = key
+        complete = self.available == len(self.samples) or tile_span(level, index)[1] + N_FFT // 2 <= self.available
+        self.pending[key] = self.pool.submit(self._compute, self.generation, self.samples, key, complete)
+
+    def _compute(self, generation, samples, key, complete):
+        with instrument.span("spectrogram.tile", level=key[0]):
+            tile = compute_tile(samples, *key)
+        self.tile_ready.emit(generation, key, tile, complete)
+
+    def on_tile_ready(self, generation, key, tile, complete):
+        if generation != self.generation: return
+        self.pending.pop(key, None)
+        if complete:
+            self.cache.put(key, tile)
+        if key in self.visible_keys:
+            self._show(key, tile, complete)
+
+    def _show(self, key, tile, complete):
+        level, index = key
+        hop = 1 << level
+        image = self.images[key][0] if key in self.images else None
+        if image is None:
+            image = pg.ImageItem()
+            image.setParentItem(self)
+            image.setLookupTable(self.lut)
+        image.setImage(tile, autoLevels=False, levels=(0, 255))
+        start = self.offset + tile_span(level, index)[0] - hop / 2
+        image.setRect(QRectF(start / self.sr, 0, TILE_FRAMES * hop / self.sr, self.sr / 2))
+        self.images[key] = (image, complete)
+
+
+class AnnotationItem(pg.GraphicsObject):
+    MAX_LABELS = 500
+
+    def __init__(self, store, y_range=(-1.1, 1.1), brush=None, pen=None, labels=True):
+        super().__init__()
+        self.store = store
+        self.y_range = y_range
+        self.label_y = 1.0
+        self.brush = pg.mkBrush(brush or THEME['saved_region'])
+        self.pen = pg.mkPen(pen) if pen else pg.mkPen(None)
+        self.pen.setCosmetic(True)
+        self.labels = labels
+        self.text_pen = QPen(QColor(THEME['fg']))
+
+    def refresh(self):
+        self.prepareGeometryChange()
+        self.update()
+
+    def dataBounds(self, ax, frac=1.0, orthoRange=None):
+        return (None, None)
+
+    def boundingRect(self):
+        if len(self.store) == 0:
+            return QRectF()
+        x0 = float(self.store.starts[0])
+        x1 = float(self.store.max_end)
+        y0, y1 = self.y_range
+        return QRectF(x0, y0, max(x1 - x0, 1e-9), y1 - y0)
+
+    def index_at(self, x):
+        return self.store.index_at(x)
+
+    def _merge_to_pixels(self, starts, ends, x_min, x_max, width_px):
+        # More spans than pixels: draw the covered pixel runs instead of every span
+        scale = width_px / max(x_max - x_min, 1e-12)
+        a = np.clip(np.floor((starts - x_min) * scale), 0, width_px).astype(np.int64)
+        b = np.clip(np.ceil((ends - x_min) * scale), 0, width_px).astype(np.int64)
+        b = np.maximum(b, np.minimum(a + 1, width_px))
+        depth = np.cumsum(np.bincount(a, minlength=width_px + 1) - np.bincount(b, minlength=width_px + 1))
+        edges = np.diff((depth[:width_px] > 0).astype(np.int8), prepend=0, append=0)
+        run_starts = np.nonzero(edges == 1)[0]
+        run_ends = np.nonzero(edges == -1)[0]
+        return x_min + run_starts / scale, x_min + run_ends / scale
+
+    def paint(self, p, *args):
+        vb = self.getViewBox()
+        if vb is None or len(self.store) == 0: return
+        x_min, x_max = vb.viewRange()[0]
+        idx = self.store.visible(x_min, x_max)
+        if not len(idx): return
+        starts = self.store.starts[idx]
+        ends = self.store.ends[idx]
+        y0, y1 = self.y_range
+
+        p.setPen(self.pen)
+        p.setBrush(self.brush)
+        width_px = max(1, int(vb.width()))
+        if len(idx) > width_px:
+            starts, ends = self._merge_to_pixels(starts, ends, x_min, x_max, width_px)
+        p.drawRects([QRectF(s, y0, e - s, y1 - y0) for s, e in zip(starts, ends)])
+        if not self.labels or len(idx) > self.MAX_LABELS: return
+
+        # Labels are drawn in device coordinates so the view transform does not stretch them
+        tr = p.transform()
+        px_per_unit = tr.m11()
+        fm = QFontMetricsF(p.font())
+        p.resetTransform()
+        p.setPen(self.text_pen)
+        label_ids = self.store.label_ids[idx]
+        for s, e, label_id in zip(starts, ends, label_ids):
+            text = self.store.labels[label_id]
+            text_w = fm.horizontalAdvance(text)
+            if text_w > (e - s) * px_per_unit: continue
+            anchor = tr.map(QPointF((s + e) / 2, self.label_y))
+            p.drawText(QPointF(anchor.x() - text_w / 2, anchor.y() - fm.descent()), text)
+        p.setTransform(tr)
+
+
+class OverviewItem(pg.GraphicsObject):
+    # Whole file at a glance: the envelope from the coarsest peak level with at most MAX_BUCKETS
+    # buckets and, below it, how many annotations cover each of DENSITY_BINS bins. Neither
+    # depends on the file length or reads a single sample
+    MAX_BUCKETS = 4096
+    DENSITY_BINS = 1024
+
+    def __init__(self, color, density_color, y_range=(-1.0, 1.0), band=(-1.6, -1.1)):
+        super().__init__()
+        self.brush = pg.mkBrush(color)
+        self.density_brush = pg.mkBrush(density_color)
+        self.y_range = y_range
+        self.band = band
+        self.pyramid = None
+        self.sr = 1
+        self.offset = 0
+        self.duration = 0.0
+        self.path = QPainterPath()
+        self.bars = []
+        # Rasterized once per content or size change; moving the viewport over it is a blit
+        self.setCacheMode(self.CacheMode.DeviceCoordinateCache)
+
+    def set_audio(self, pyramid, sr, n_samples, offset=0):
+        # n_samples is the length of the whole file; the pyramid may cover only the part from offset
+        self.prepareGeometryChange()
+        self.pyramid = pyramid
+        self.sr = sr
+        self.offset = offset
+        self.duration = n_samples / sr
+        self.refresh_envelope()
+
+    def clear_audio(self):
+        self.prepareGeometryChange()
+        self.pyramid = None
+        self.duration = 0.0
+        self.path = QPainterPath()
+        self.bars = []
+        self.update()
+
+    def refresh_envelope(self):
+        # Also called while a file loads; only buckets the pyramid has filled are drawn
+        pyramid = self.pyramid
+        self.path = QPainterPath()
+        if pyramid is not None and pyramid.levels:
+            level = next((i for i, (mins, _) in enumerate(pyramid.levels) if len(mins) <= self.MAX_BUCKETS),
+                         len(pyramid.levels) - 1)
+            mins, maxs = pyramid.levels[level]
+            size = pyramid.bucket_size(level)
+            n = min(len(mins), -(-pyramid.filled // size))
+            if n:
+                x = (self.offset + np.arange(n) * size) / self.sr
+                self.path = pg.arrayToQPath(np.concatenate([x, x[::-1]]),
+                                            np.concatenate([maxs[:n], mins[:n][::-1]]), connect='all')
+                self.path.closeSubpath()
+        self.update()
+
+    def set_annotations(self, starts, ends):
+        self.bars = []
+        if self.duration > 0 and len(starts):
+            bins = self.DENSITY_BINS
+            scale = bins / self.duration
+            a = np.clip((starts * scale).astype(np.int64), 0, bins - 1)
+            b = np.clip((ends * scale).astype(np.int64), 0, bins - 1)
+            depth = np.cumsum(np.bincount(a, minlength=bins + 1) - np.bincount(b + 1, minlength=bins + 1))[:bins]
+            y0, y1 = self.band
+            height = (y1 - y0) / max(1, depth.max())
+            self.bars = [QRectF(i / scale, y0, 1 / scale, depth[i] * height) for i in np.nonzero(depth)[0]]
+        self.update()
+
+    def dataBounds(self, ax, frac=1.0, orthoRange=None):
+        return (None, None)
+
+    def boundingRect(self):
+        if self.duration <= 0:
+            return QRectF()
+        return QRectF(0, self.band[0], self.duration, self.y_range[1] - self.band[0])
+
+    def paint(self, p, *args):
+        p.setPen(Qt.PenStyle.NoPen)
+        p.fillPath(self.path, self.brush)
+        if self.bars:
+            p.setBrush(self.density_brush)
+            p.drawRects(self.bars)
+
+
+class CursorItem(pg.GraphicsObject):
+    # Playback cursor: a line with a round marker at the top and bottom of the view. Moving it
+    # only repaints the strip it leaves and the strip it enters
+    MARKER_PX = 14
+
+    def __init__(self, color, width=2):
+        super().__init__()
+        self.pen = pg.mkPen(color, width=width)
+        self.marker_pen = pg.mkPen(color)
+        self.brush = pg.mkBrush(color)
+        self.rect = None
+        self.setAcceptedMouseButtons(Qt.MouseButton.NoButton)
+
+    def value(self):
+        return self.pos().x()
+
+    def setPos(self, x):
+        if x != self.pos().x():
+            super().setPos(QPointF(float(x), 0.0))
+
+    def dataBounds(self, ax, frac=1.0, orthoRange=None):
+        return (None, None)
+
+    def viewTransformChanged(self):
+        super().viewTransformChanged()
+        self.prepareGeometryChange()
+        self.rect = None
+
+    def viewRangeChanged(self):
+        self.viewTransformChanged()
+
+    def boundingRect(self):
+        if self.rect is None:
+            view = self.viewRect()
+            if view is None:
+                return QRectF()
+            half = self.MARKER_PX / 2 * (self.pixelWidth() or 0.0)
+            self.rect = QRectF(-half, view.top(), 2 * half, view.height())
+        return self.rect
+
+    def paint(self, p, *args):
+        rect = self.boundingRect()
+        if rect.isEmpty(): return
+        p.setPen(self.pen)
+        p.drawLine(QPointF(0, rect.top()), QPointF(0, rect.bottom()))
+        # Markers are drawn in device coordinates so they stay round at any zoom
+        tr = p.transform()
+        p.resetTransform()
+        p.setRenderHint(QPainter.RenderHint.Antialiasing)
+        p.setPen(self.marker_pen)
+        p.setBrush(self.brush)
+        radius = self.MARKER_PX / 2
+        for y in (rect.top(), rect.bottom()):
+            p.drawEllipse(tr.map(QPointF(0, y)), radius, radius)
+        p.setTransform(tr)
+
+
+class ViewScheduler(QObject):
+    # Pan, kinetic zoom and deferred view work are merged and applied at most once per display
+    # frame, so a burst of mouse or wheel events costs one range change
+    ZOOM_IMPULSE = 2.5
+    ZOOM_FRICTION = 10.0
+    MIN_VELOCITY = 0.02
+    MIN_SPAN = 1e-3
+    MAX_STEP = 0.05
+    # Zooming out stops once the whole file and this fraction of it on top are in view
+    EXTENT_PAD = 0.1
+
+    def __init__(self, view_box, parent=None):
+        super().__init__(parent)
+        self.vb = view_box
+        self.pan_px = 0.0
+        self.zoom_velocity = 0.0
+        self.zoom_anchor = 0.0
+        self.extent = None
+        self.tasks = {}
+        self.last_frame = None
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setTimerType(Qt.TimerType.PreciseTimer)
+        self.timer.setInterval(self.frame_interval())
+        self.timer.timeout.connect(self.on_frame)
+
+    @staticmethod
+    def frame_interval():
+        screen = QGuiApplication.primaryScreen()
+        rate = screen.refreshRate() if screen else 0
+        return max(4, int(1000 / rate)) if rate > 0 else 16
+
+    def set_extent(self, seconds):
+        # Length of the file on screen; None lifts the zoom-out limit
+        self.extent = seconds if seconds and seconds > 0 else None
+
+    def request(self, key, callback):
+        # Only the latest callback per key runs, once, on the next frame
+        self.tasks[key] = callback
+        self._schedule()
+
+    def pan(self, dx_px):
+        self.pan_px += dx_px
+        self._schedule()
+
+    def zoom(self, steps, anchor):
+        # Each wheel notch adds velocity in log-zoom per second; friction lets it glide to a stop.
+        # Reversing direction cancels the glide instead of fighting it
+        if steps * self.zoom_velocity < 0:
+            self.zoom_velocity = 0.0
+        self.zoom_velocity += steps * self.ZOOM_IMPULSE
+        self.zoom_anchor = anchor
+        self._schedule()
+
+    def stop(self):
+        self.pan_px = 0.0
+        self.zoom_velocity = 0.0
+
+    def _schedule(self):
+        if not self.timer.isActive():
+            self.timer.start()
+
+    def on_frame(self):
+        now = time.perf_counter()
+        dt = min(self.MAX_STEP, now - self.last_frame) if self.last_frame else self.timer.interval() / 1000
+        self.last_frame = now
+        if self.pan_px or self.zoom_velocity:
+            self._apply_range(dt)
+        tasks, self.tasks = self.tasks, {}
+        for callback in tasks.values():
+            callback()
+        if self.zoom_velocity:
+            self.timer.start()
+        else:
+            self.last_frame = None
+
+    def _apply_range(self, dt):
+        x_min, x_max = self.vb.viewRange()[0]
+        span = x_max - x_min
+        shift = -self.pan_px * span / max(1.0, self.vb.width())
+        self.pan_px = 0.0
+        x_min, x_max = x_min + shift, x_max + shift
+        if self.zoom_velocity:
+            factor = math.exp(-self.zoom_velocity * dt)
+            if span * factor < self.MIN_SPAN:
+                factor = self.MIN_SPAN / span
+                self.zoom_velocity = 0.0
+            elif factor > 1 and self.extent is not None and span * factor > self.extent * (1 + self.EXTENT_PAD):
+                # A view already wider than that only stops growing
+                factor = max(1.0, self.extent * (1 + self.EXTENT_PAD) / span)
+                self.zoom_velocity = 0.0
+            anchor = self.zoom_anchor + shift
+            x_min = anchor - (anchor - x_min) * factor
+            x_max = anchor + (x_max - anchor) * factor
+            self.zoom_velocity *= math.exp(-self.ZOOM_FRICTION * dt)
+            if abs(self.zoom_velocity) < self.MIN_VELOCITY:
+                self.zoom_velocity = 0.0
+        self.vb.setXRange(x_min, x_max, padding=0)
+
+
+class PerformanceHud(QLabel):
+    # Read-only overlay pinned to the top-right corner of its parent
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.setAttribute(Qt.WidgetAttribute.WA_TransparentForMouseEvents)
+        self.setStyleSheet("background-color: rgba(0, 0, 0, 170); color: #e0e0e0; font-family: 'Consolas'; "
+                           "padding: 6px; border-radius: 4px;")
+        self.hide()
+
+    def show_text(self, text):
+        self.setText(text)
+        self.adjustSize()
+        self.move(self.parentWidget().width() - self.width() - 8, 8)
+        self.raise_()
+
+
 class CustomPlotWidget(pg.PlotWidget):
     sig_clicked = pyqtSignal(float)
     sig_saved_clicked = pyqtSignal(object)
+    SNAP_PX = 8
 
     def __init__(self, parent=None, **kwargs):
         super().__init__(parent, **kwargs)
         self.selection_item = None
+        self.annotation_item = None
+        self.snap_index = None
+        self.snap_enabled = True
         self.zoom_preview_item = None 
         
         self.mode = 'select' 
@@ -37,6 +741,7 @@ class CustomPlotWidget(pg.PlotWidget):
         
         self.plotItem.setMouseEnabled(x=True, y=False)
         self.plotItem.setMenuEnabled(False)
+        self.scheduler = ViewScheduler(self.plotItem.vb, self)
 
         self.zoom_preview_item = pg.LinearRegionItem(values=(0, 0), brush=pg.mkBrush(THEME['zoom_selection']), movable=False)
         self.zoom_preview_item.setZValue(100) 
@@ -52,21 +757,32 @@ class CustomPlotWidget(pg.PlotWidget):
         else: 
             self.setCursor(Qt.CursorShape.ArrowCursor)
 
+    def snap(self, x):
+        # Selection edges snap to onsets and zero crossings within SNAP_PX; Shift drags freely
+        if self.snap_index is None or not self.snap_enabled: return x
+        if QApplication.keyboardModifiers() & Qt.KeyboardModifier.ShiftModifier: return x
+        vb = self.plotItem.vb
+        x_min, x_max = vb.viewRange()[0]
+        return self.snap_index.snap(x, self.SNAP_PX * (x_max - x_min) / max(1.0, vb.width()))
+
+    def paintEvent(self, event):
+        with instrument.span("scene.paint"):
+            super().paintEvent(event)
+
     def mousePressEvent(self, event: QMouseEvent):
-        if event.button() == Qt.MouseButton.LeftButton and self.mode == 'select':
-            pos_in_scene = self.mapToScene(event.position().toPoint())
-            items = self.scene().items(pos_in_scene)
-            for item in items:
-                if isinstance(item, pg.LinearRegionItem) and getattr(item, 'is_saved', False):
-                    self.sig_saved_clicked.emit(item)
-                    event.accept()
-                    return
+        if event.button() == Qt.MouseButton.LeftButton and self.mode == 'select' and self.annotation_item:
+            point = self.plotItem.vb.mapSceneToView(event.position())
+            index = self.annotation_item.index_at(point.x())
+            if index is not None:
+                self.sig_saved_clicked.emit(index)
+                event.accept()
+                return
 
         if event.button() == Qt.MouseButton.LeftButton:
             if self.mode == 'select':
                 self.is_selecting = True
                 point = self.plotItem.vb.mapSceneToView(event.position())
-                self.start_pos = point.x()
+                self.start_pos = self.snap(point.x())
                 self.sig_clicked.emit(self.start_pos)
                 if self.selection_item:
                     self.selection_item.setRegion([self.start_pos, self.start_pos])
@@ -100,7 +816,7 @@ class CustomPlotWidget(pg.PlotWidget):
 
         if self.is_selecting and self.mode == 'select':
             if self.selection_item:
-                self.selection_item.setRegion([self.start_pos, current_pos])
+                self.selection_item.setRegion([self.start_pos, self.snap(current_pos)])
             event.accept()
 
         elif self.is_zooming and self.mode == 'zoom':
@@ -108,24 +824,23 @@ class CustomPlotWidget(pg.PlotWidget):
             event.accept()
 
         elif self.is_panning:
+            # Deltas are summed and applied once per frame by the scheduler
             current_x_pixel = event.globalPosition().x()
-            delta_px = current_x_pixel - self.pan_start_x
-            
-            view_box = self.plotItem.vb
-            view_range = view_box.viewRange()[0]
-            screen_width_px = self.viewport().width()
-            
-            if screen_width_px > 0:
-                view_width_units = view_range[1] - view_range[0]
-                units_per_px = view_width_units / screen_width_px
-                dx_units = -delta_px * units_per_px
-                view_box.translateBy(x=dx_units, y=0)
-
+            self.scheduler.pan(current_x_pixel - self.pan_start_x)
             self.pan_start_x = current_x_pixel
             event.accept()
         else:
             super().mouseMoveEvent(event)
 
+    def wheelEvent(self, event: QWheelEvent):
+        # Mouse wheels and trackpads both report angleDelta in eighths of a degree, 120 per notch
+        steps = event.angleDelta().y() / 120
+        if not steps:
+            return super().wheelEvent(event)
+        point = self.plotItem.vb.mapSceneToView(event.position())
+        self.scheduler.zoom(steps, point.x())
+        event.accept()
+
     def mouseReleaseEvent(self, event: QMouseEvent):
         if event.button() == Qt.MouseButton.LeftButton:
             if self.mode == 'select':
@@ -146,6 +861,7 @@ class CustomPlotWidget(pg.PlotWidget):
                     event.accept()
                     return
 
+                self.scheduler.stop()
                 modifiers = QApplication.keyboardModifiers()
                 is_shift = (modifiers & Qt.KeyboardModifier.ShiftModifier)
 
@@ -1,18 +1,172 @@
-import librosa
-from PyQt6.QtCore import QThread, pyqtSignal
+from concurrent.futures import ThreadPoolExecutor
+from PyQt6.QtCore import QObject, QThread, pyqtSignal
+import instrument
+from decoders import BLOCK_FRAMES, allocate_store, decode_range, open_decoder
+from export import export_clips
+from peaks import PeakPyramid
+from proposals import FrameFeatures
+from snapping import SnapIndex
 
 class AudioLoaderThread(QThread):
-    finished_loading = pyqtSignal(object, float, object)
+    started_loading = pyqtSignal(object, float, object)
+    chunk_loaded = pyqtSignal(int)
+    progress = pyqtSignal(int)
+    finished_loading = pyqtSignal(object, float, object, object)
+    cancelled = pyqtSignal(int)
     error_occurred = pyqtSignal(str)
 
-    def __init__(self, path):
+    def __init__(self, path, cache=None):
         super().__init__()
         self.path = path
+        self.cache = cache
+        self.from_cache = False
 
     def run(self):
         try:
-            y, sr = librosa.load(self.path, sr=None)
-            duration = len(y) / sr
-            self.finished_loading.emit(y, sr, duration)
+            with instrument.span("cache.load"):
+                cached = self.cache.load(self.path) if self.cache else None
+            if cached:
+                self.from_cache = True
+                store, sr, pyramid = cached
+                self.started_loading.emit(store, float(sr), pyramid)
+            else:
+                store, sr, pyramid = self.decode()
+                if store is None: return
+                if self.cache:
+                    self.cache.store(self.path, store, sr, pyramid)
+            self.progress.emit(100)
+            duration = len(store) / sr
+            self.finished_loading.emit(store, sr, duration, pyramid)
         except Exception as e:
-            self.error_occurred.emit(str(e))
\ No newline at end of file
+            self.error_occurred.emit(str(e))
+
+    @instrument.timed("decode")
+    def decode(self):
+        decoder = open_decoder(self.path)
+        try:
+            sr = decoder.sr
+            total = decoder.frames
+            # Every channel is kept; the peaks are built over the mix the view starts on
+            store = allocate_store(decoder)
+            mix = store.view()
+            pyramid = PeakPyramid(n_samples=total)
+            self.started_loading.emit(store, float(sr), pyramid)
+            filled = 0
+            while filled < total:
+                if self.isInterruptionRequested():
+                    self.cancelled.emit(filled)
+                    return None, sr, pyramid
+                block = decoder.read_frames(min(BLOCK_FRAMES, total - filled), store.dtype)
+                if len(block) == 0: break
+                end = filled + len(block)
+                store.write(filled, block)
+                pyramid.update(mix, filled, end)
+                filled = end
+                self.chunk_loaded.emit(filled)
+                self.progress.emit(int(100 * filled / max(1, total)))
+        finally:
+            decoder.close()
+
+        if filled < total:
+            store = store.truncate(filled)
+            pyramid = PeakPyramid(store.view())
+        return store, sr, pyramid
+
+
+class RangeLoaderThread(QThread):
+    # Decodes [start, stop) seconds of a file and, given the window already in memory, joins
+    # the two when they touch; the peaks are rebuilt for the lane on screen
+    finished_loading = pyqtSignal(object, float, int, int, object)
+    error_occurred = pyqtSignal(str)
+
+    def __init__(self, path, start, stop, base=None, base_first=0, channel=None):
+        super().__init__()
+        self.path = path
+        self.start_s = start
+        self.stop_s = stop
+        self.base = base
+        self.base_first = base_first
+        self.channel = channel
+
+    def run(self):
+        try:
+            with instrument.span("decode.range"):
+                store, sr, first, total = decode_range(self.path, self.start_s, self.stop_s)
+            base = self.base
+            if base is not None and first <= self.base_first + len(base) and self.base_first <= first + len(store):
+                store = base.merged(store, first - self.base_first)
+                first = min(first, self.base_first)
+            pyramid = PeakPyramid(store.view(self.channel))
+            self.finished_loading.emit(store, float(sr), first, total, pyramid)
+        except Exception as e:
+            self.error_occurred.emit(str(e))
+
+
+class ExportThread(QThread):
+    progress = pyqtSignal(int)
+    finished_export = pyqtSignal(int, str)
+    error_occurred = pyqtSignal(str)
+
+    def __init__(self, sources, out_dir, cache_root, **options):
+        super().__init__()
+        self.sources = sources
+        self.out_dir = out_dir
+        self.cache_root = cache_root
+        self.options = options
+
+    def run(self):
+        try:
+            count = export_clips(self.sources, self.out_dir, cache_root=self.cache_root,
+                                 progress=lambda done, total: self.progress.emit(int(100 * done / max(1, total))),
+                                 should_stop=self.isInterruptionRequested, **self.options)
+            self.finished_export.emit(count, self.out_dir)
+        except Exception as e:
+            self.error_occurred.emit(str(e))
+
+
+class ProposalEngine(QObject):
+    # Keeps frame features of the current audio up to date on one background thread, and
+    # builds the snapping index once the whole file is there
+    updated = pyqtSignal(int)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.pool = ThreadPoolExecutor(max_workers=1)
+        self.generation = 0
+        self.samples = None
+        self.offset = 0
+        self.features = None
+        self.snap_index = None
+
+    def set_audio(self, samples, sr, available=None, offset=0):
+        # Features are indexed from samples[0], which is file position offset
+        if samples is not self.samples or offset != self.offset:
+            self.generation += 1
+            self.samples = samples
+            self.offset = offset
+            self.features = FrameFeatures(len(samples), sr)
+            self.snap_index = None
+        self.set_available(len(samples) if available is None else available)
+
+    def set_available(self, available):
+        if self.features is None: return
+        self.pool.submit(self._update, self.generation, self.features, self.samples, available, self.offset)
+
+    def _update(self, generation, features, samples, available, offset):
+        if generation != self.generation: return
+        features.update(samples, available)
+        if available >= len(samples) and self.snap_index is None:
+            snap_index = SnapIndex(samples, features.sr, features, offset)
+            if generation == self.generation:
+                self.snap_index = snap_index
+        self.updated.emit(generation)
+
+    def clear(self):
+        self.generation += 1
+        self.samples = None
+        self.features = None
+        self.snap_index = None
+
+    def shutdown(self):
+        self.clear()
+        self.pool.shutdown(wait=False, cancel_futures=True)